@@ -1,63 +1,145 @@
-import tkinter as tk
-from tkinter import filedialog, messagebox, IntVar, BooleanVar
+import numpy as np
 import pandas as pd
-from collections import defaultdict
+from collections import defaultdict, Counter
+import bisect
 import datetime
 import os
-from openpyxl import Workbook
-import win32com.client
-from openpyxl.styles import Alignment
-
-#ログ出力
-def log(message):
-    with open("log.txt", "a", encoding="utf-8") as f:#保存場所
-        f.write(f"[{datetime.datetime.now()}] {message}\n")
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+import profiler
+from records import Person, Match, OpenSlot, intern_text
+from timeslot import intern_slot, convert_date, parse_date, parse_time_range, split_slot, sheet_title
+
+LOG_PATH = "log.txt"#保存場所
+logger = logging.getLogger("ShinkanMatch")
+LOG_FORMAT = "[%(asctime)s] [%(levelname)s] %(message)s"
+
+#ログレベル：引数 ➡ 環境変数 SHINKAN_LOG_LEVEL ➡ INFO の順
+def set_log_level(level=None):
+    if level is None:
+        level = os.environ.get("SHINKAN_LOG_LEVEL", "INFO")
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    logger.setLevel(level)
+
+#ログ設定：ファイルへの書き込みは別スレッドでまとめて行い、サイズが上限を超えたらローテーションする
+def setup_logging(level=None, path=LOG_PATH, max_bytes=1024 * 1024, backup_count=3):
+    set_log_level(level)
+    if logger.handlers:
+        return
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                   encoding="utf-8", delay=True)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.propagate = False
+    listener.start()
+    atexit.register(listener.stop)#終了時に残りを書き出す
+
+#プロセスプールのワーカー用（initializer で呼ぶ）
+#fork したワーカーは親の QueueHandler を引き継ぐが、書き出すスレッド（QueueListener）は引き継がないので、
+#引き継いだハンドラを外して、同じファイルに直接追記するハンドラを付け直す（ローテーションは親だけが行う）
+def setup_worker_logging(level=None, path=LOG_PATH):
+    set_log_level(level)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    handler = logging.FileHandler(path, encoding="utf-8", delay=True)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger.addHandler(handler)
+    logger.propagate = False
+
+#ログ出力（詳細な行ごとのログは level=logging.DEBUG で出す）
+def log(message, level=logging.INFO):
+    if not logger.handlers:
+        setup_logging()
+    logger.log(level, message)
+
+def debug_enabled():
+    if not logger.handlers:
+        setup_logging()
+    return logger.isEnabledFor(logging.DEBUG)
+
+INSTRUMENTS = ['ギター', 'ベース', 'ドラム', 'キーボード', 'その他']#楽器の種類
+INSTRUMENT_NAMES = {name: name for name in INSTRUMENTS}#読み込んだ楽器名を共通の文字列にそろえる
+ENGINES = ["greedy", "flow", "parallel"]#match() の割り当て方式
+ORDERS = ["availability", "options"]#貪欲法の割り当て順
 
 #希望楽器データ成形
 def clean_instrument_field(text):
     if pd.isna(text): return []
-    allowed = ['ギター', 'ベース', 'ドラム', 'キーボード', 'その他']#楽器の種類
     parts = [p.strip() for p in str(text).replace('\n', ',').split(',')]
-    return [p for p in parts if p in allowed]
-
-#日付➡時間抽出
-def extract_availability(df):
-    date_columns = [col for col in df.columns[4:] if isinstance(col, str) and '/' in col]
-    log(f"[extract_availability] 検出された日付列: {date_columns}")
-    availability = []
-    for row_idx, (_, row) in enumerate(df.iterrows()):
-        slots = []
-        for col in date_columns:
-            val = row[col]
-            if pd.isna(val):
-                log(f"[row {row_idx}] {col} は NaN")
-                continue
-            try:
-                if isinstance(val, str):
-                    for t in val.split(','):
-                        if pd.isna(t):
-                            log(f"[row {row_idx}] {col} の中の要素が NaN: {t}")
-                            continue
-                        t = str(t).strip()
-                        if t and t.lower() != 'nan':
-                            slots.append((col.strip(), t))
-                else:
-                    t = str(val).strip()
-                    if t and t.lower() != 'nan':
-                        slots.append((col.strip(), t))
-            except Exception as e:
-                log(f"[row {row_idx}] エラー: col={col}, val={val}, type={type(val)}, error={e}")
-        log(f"[row {row_idx}] 抽出された時間帯: {slots}")
-        availability.append(slots)
-    return availability
-
-
-#個人ごとに希望を纏める関数
+    return [p for p in parts if p in INSTRUMENTS]
+
+#日付列の検出（E列以降で "/" を含む列名）
+def detect_date_columns(df):
+    return [col for col in df.columns[4:] if isinstance(col, str) and '/' in col]
+
+#日付➡時間抽出（日付列を縦に並べて、まとめて分割し Slot にする）
+@profiler.timed("extract_availability")
+def extract_availability(df, date_columns=None):
+    if date_columns is None:
+        date_columns = detect_date_columns(df)
+        log(f"[extract_availability] 検出された日付列: {date_columns}")
+    availability = [[] for _ in range(len(df))]
+    if not date_columns:
+        return [()] * len(df), {}
+
+    #行優先で1列に並べる（位置 i ➡ 行 i // 列数, 列 i % 列数）
+    width = len(date_columns)
+    cells = pd.Series(df[date_columns].to_numpy(dtype=object).ravel())
+    cells = cells[cells.notna()]
+
+    #文字列のセルだけ "," で分割、それ以外はそのまま1件
+    texts = cells.astype(str)
+    is_text = cells.map(lambda v: isinstance(v, str))
+    tokens = pd.concat([texts[is_text].str.split(',').explode(), texts[~is_text]]).sort_index(kind="stable")
+    tokens = tokens.str.strip()
+    tokens = tokens[(tokens != "") & (tokens.str.lower() != 'nan')]
+
+    #日付・時間帯は同じ文字列が何度も出てくるので、種類ごとに1回だけ解釈する
+    days = [parse_date(col) for col in date_columns]
+    for col, day in zip(date_columns, days):
+        if day is None:
+            log(f"[extract_availability] 日付として読めない列: {col}", logging.WARNING)
+    ranges = {t: parse_time_range(t) for t in tokens.unique().tolist()}
+    unreadable = [t for t, r in ranges.items() if r is None]
+    if unreadable:
+        log(f"[extract_availability] 時間帯として読めない値: {unreadable}", logging.WARNING)
+
+    unparsed = defaultdict(list)#行 ➡ 読めなかった (日付列, 値)
+    for i, t in zip(tokens.index.tolist(), tokens.tolist()):
+        day = days[i % width]
+        minutes = ranges[t]
+        if day is not None and minutes is not None:
+            availability[i // width].append(intern_slot(day, *minutes))
+        else:
+            unparsed[i // width].append((str(date_columns[i % width]), t))
+    availability = [tuple(slots) for slots in availability]#1行の楽器違いで共有する（変更不可）
+    unparsed = {row: tuple(values) for row, values in unparsed.items()}
+    log(f"[extract_availability] {len(df)}行, 時間帯 {len(tokens)}件")
+
+    if debug_enabled():
+        present = set(cells.index.tolist())
+        for row_idx in range(len(df)):
+            for j, col in enumerate(date_columns):
+                if row_idx * width + j not in present:
+                    log(f"[row {row_idx}] {col} は NaN", logging.DEBUG)
+            log(f"[row {row_idx}] 抽出された時間帯: {availability[row_idx]}", logging.DEBUG)
+    return availability, unparsed
+
+
+#個人ごとに希望を纏める関数（楽器ごとに1件）
+@profiler.timed("parse_people")
 def parse_people(df):
-    availability = extract_availability(df)
-
-    date_columns = [col for col in df.columns[4:] if isinstance(col, str) and '/' in col]
+    date_columns = detect_date_columns(df)
     log(f"[parse_people] 日付列検出: {date_columns}")
+    availability, unparsed = extract_availability(df, date_columns)
     if not date_columns:
         log("[parse_people] エラー: 日付列が1つも検出されませんでした")
         raise ValueError("日付列が見つかりませんでした")
@@ -66,338 +148,847 @@ def parse_people(df):
     remarks_col_index = instrument_col_index + 1
     log(f"[parse_people] 楽器列 index: {instrument_col_index}, 備考列 index: {remarks_col_index}")
 
-    people = []
-    for i, (_, row) in enumerate(df.iterrows()):
-        try:
-            name = row[2]
-            line = row[3]
-            instruments = clean_instrument_field(row[instrument_col_index])
-            remarks = row[remarks_col_index] if remarks_col_index < len(row) else ""
-            log(f"[row {i}] 名前: {name}, LINE: {line}, 楽器: {instruments}, 備考: {remarks}, availability: {availability[i]}")
-            for inst in instruments:
-                people.append({
-                    "name": name,
-                    "line": line,
-                    "instrument": inst,
-                    "remarks": remarks,
-                    "availability": availability[i]
-                })
-        except Exception as e:
-            log(f"[row {i}] parse_people エラー: {e}")
-            raise
+    names = df.iloc[:, 2].tolist()
+    lines = df.iloc[:, 3].tolist()
+    remarks = df.iloc[:, remarks_col_index].tolist() if remarks_col_index < df.shape[1] else [""] * len(df)
+
+    #楽器列を一括で分割して1行1楽器に展開
+    instruments = df.iloc[:, instrument_col_index].reset_index(drop=True)
+    instruments = instruments[instruments.notna()].astype(str)
+    instruments = instruments.str.replace('\n', ',').str.split(',').explode().str.strip()
+    instruments = instruments[instruments.isin(INSTRUMENTS)]
+
+    people = [Person(intern_text(names[i]), intern_text(lines[i]), INSTRUMENT_NAMES[inst], remarks[i], availability[i],
+                     unparsed.get(i, ()))
+              for i, inst in zip(instruments.index.tolist(), instruments.tolist())]
+    log(f"[parse_people] {len(df)}行 ➡ {len(people)}件")
+    if debug_enabled():
+        for p in people:
+            log(f"名前: {p.name}, LINE: {p.line}, 楽器: {p.instrument}, 備考: {p.remarks}, availability: {p.availability}", logging.DEBUG)
     return people
 
 
-# 時間分割処理関数
-
-def split_time_range(time_str, interval_minutes):
-    try:
-        start_str, end_str = time_str.split('-')
-        start = datetime.datetime.strptime(start_str.strip(), '%H:%M')
-        end = datetime.datetime.strptime(end_str.strip(), '%H:%M')
-        slots = []
-        while start + datetime.timedelta(minutes=interval_minutes) <= end:
-            slot_end = start + datetime.timedelta(minutes=interval_minutes)
-            slots.append(f"{start.strftime('%H:%M')}-{slot_end.strftime('%H:%M')}")
-            start = slot_end
-        return slots
-    except:
-        return [time_str]
-#講師の時間を分割
+#Excel から直接 parse_people する（calamine があれば一括、なければ chunksize 行ずつ読みながら解析）
+#progress: progress(段階名, 済んだ数, 全体の数 or None) をチャンクごとに呼ぶ（例外を投げれば中断）
+def read_people(path, sheet=0, chunksize=5000, progress=None):
+    from reader import FAST_ENGINE, read_sheet, iter_frames
+    if FAST_ENGINE:
+        with profiler.stage("read_excel"):
+            df = read_sheet(path, sheet)
+        return parse_people(df)
+    people = []
+    rows = 0
+    frames = iter_frames(path, sheet, chunksize=chunksize)
+    while True:
+        with profiler.stage("read_excel"):
+            chunk = next(frames, None)
+        if chunk is None:
+            return people
+        people.extend(parse_people(chunk))
+        rows += len(chunk)
+        if progress is not None:
+            progress("read_excel", rows, None)
+
+
+#講師の時間を分割（元の講師はそのままで、分割した枠を持つ新しい講師を返す）
+@profiler.timed("expand_teacher_availability")
 def expand_teacher_availability(teachers, interval):
+    return [t._replace(availability=tuple(s for slot in t.availability for s in split_slot(slot, interval)))
+            for t in teachers]
+
+#(楽器, 枠) ➡ その枠に入れる講師の索引
+@profiler.timed("build_teacher_index")
+def build_teacher_index(teachers):
+    index = defaultdict(list)
+    for teacher in teachers:
+        for slot in dict.fromkeys(teacher.availability):#重複した枠は1回だけ登録
+            index[(teacher.instrument, slot)].append(teacher)
+    return index
+
+#読み込んだ講師の分割・索引を設定ごとに1回だけ作って使い回す（常駐サービスなどで講師が変わらないとき）
+#match() / MatchState に講師のリストの代わりに渡せる
+#split_interval: 講師がすでにその単位で分割済みのとき（分割し直さずにそのまま使う）
+class TeacherRoster:
+    def __init__(self, teachers, split_interval=None):
+        self.teachers = list(teachers)
+        self.prepared = {}#分割単位（分割しないときは None） ➡ (分割後の講師, 索引)
+        if split_interval is not None:
+            self.prepared[split_interval] = (self.teachers, build_teacher_index(self.teachers))
+
+    def prepare(self, allow_split, split_interval):
+        key = split_interval if allow_split else None
+        if key not in self.prepared:
+            teachers = expand_teacher_availability(self.teachers, split_interval) if allow_split else self.teachers
+            self.prepared[key] = (teachers, build_teacher_index(teachers))
+        return self.prepared[key]
+
+
+#生徒ごとに入れる（講師, 枠）の数を数える
+#全講師の枠を共通の列に並べ、楽器ごとに 講師×枠 / 生徒×枠 の真偽行列を作って掛け合わせる
+@profiler.timed("count_options")
+def count_options(teachers, students, candidate_slots):
+    columns = {}
+    for t in teachers:
+        for slot in t.availability:
+            columns.setdefault(slot, len(columns))
+    options = np.zeros(len(students), dtype=np.int64)
+    if not columns:
+        return options
+
+    by_instrument = defaultdict(list)
+    for i, s in enumerate(students):
+        by_instrument[s.instrument].append(i)
+    teachers_by_instrument = defaultdict(list)
     for t in teachers:
-        expanded = []
-        for date, time in t["availability"]:
-            split_times = split_time_range(time, interval)
-            for st in split_times:
-                expanded.append((date, st))
-        t["availability"] = expanded
-    return teachers
+        teachers_by_instrument[t.instrument].append(t)
+
+    for instrument, rows in by_instrument.items():
+        group = teachers_by_instrument.get(instrument)
+        if not group:
+            continue
+        teacher_matrix = np.zeros((len(group), len(columns)), dtype=bool)
+        for r, t in enumerate(group):
+            teacher_matrix[r, [columns[slot] for slot in t.availability]] = True
+        student_matrix = np.zeros((len(rows), len(columns)), dtype=bool)
+        for r, i in enumerate(rows):
+            cols = [columns[key] for slot in students[i].availability
+                    for key in candidate_slots(slot) if key in columns]
+            student_matrix[r, cols] = True
+        options[rows] = student_matrix.astype(np.int64) @ teacher_matrix.sum(axis=0)
+    return options
+
 
 #マッチング処理関数
+@profiler.timed("match")
 def match(teachers, students, max_per_instrument=1, drum_exclusive=True,
           allow_split=False, split_interval=30, max_pair=2,
-          drum_max_per_slot=1, prefer_same_teacher=False, prefer_continuous=False):
-
-    result = defaultdict(list)
-    teacher_usage = defaultdict(set)
-    student_instr_count = defaultdict(int)
-    student_used_slots = defaultdict(set)
-    unmatched = defaultdict(list)
-
-    students = sorted(students, key=lambda s: len(s["availability"]))
-
-    if allow_split:
-        for t in teachers:
-            expanded = []
-            for date, time in t["availability"]:
-                split_times = split_time_range(time, split_interval)
-                for st in split_times:
-                    expanded.append((date, st))
-            t["availability"] = expanded
-
-    def get_adjacent_slots(slots, target_date, base_time):
-        times = sorted(set(t for d, t in slots if d == target_date))
-        if base_time not in times:
-            return []
-        index = times.index(base_time)
-        adjacent = []
-        if index > 0: adjacent.append(times[index - 1])
-        if index < len(times) - 1: adjacent.append(times[index + 1])
-        return adjacent
-
-    def assign_slots(target_count):
-        for student in students:
-            key = (student["name"], student["instrument"])
-            if student_instr_count[key] >= target_count:
+          drum_max_per_slot=1, prefer_same_teacher=False, prefer_continuous=False,
+          engine="greedy", stats=None, progress=None, order="availability", workers=None,
+          improve_seconds=0):
+    if engine not in ENGINES:
+        raise ValueError(f"割り当て方式が不明です: {engine}（{', '.join(ENGINES)} のいずれか）")
+    if order not in ORDERS:
+        raise ValueError(f"割り当て順が不明です: {order}（{', '.join(ORDERS)} のいずれか）")
+
+    #フロー（最大流）による最適割り当て（improve_seconds・prefer_same_teacher・prefer_continuous・order は使わない）
+    if engine == "flow":
+        from flow_match import match_flow
+        ignored = [name for name, value in (("prefer_same_teacher", prefer_same_teacher),
+                                            ("prefer_continuous", prefer_continuous),
+                                            ("order", order != "availability"),
+                                            ("improve_seconds", improve_seconds > 0)) if value]
+        if ignored:
+            log(f"[match] engine=\"flow\" では使わない設定です（無視します）: {ignored}", logging.WARNING)
+        if isinstance(teachers, TeacherRoster):
+            teachers = teachers.teachers
+        if progress is not None:
+            progress("match_flow", 0, None)
+        return match_flow(teachers, students, max_per_instrument=max_per_instrument,
+                          drum_exclusive=drum_exclusive, allow_split=allow_split,
+                          split_interval=split_interval, max_pair=max_pair,
+                          drum_max_per_slot=drum_max_per_slot, stats=stats)
+
+    #日付・楽器ごとの独立したまとまりに分けて並列に解く（結果は greedy と同じ）
+    if engine == "parallel":
+        from parallel_match import match_parallel
+        return match_parallel(teachers, students, workers=workers, stats=stats, progress=progress,
+                              improve_seconds=improve_seconds,
+                              max_per_instrument=max_per_instrument, drum_exclusive=drum_exclusive,
+                              allow_split=allow_split, split_interval=split_interval, max_pair=max_pair,
+                              drum_max_per_slot=drum_max_per_slot, prefer_same_teacher=prefer_same_teacher,
+                              prefer_continuous=prefer_continuous, order=order)
+
+    state = MatchState(teachers, students, max_per_instrument=max_per_instrument,
+                       drum_exclusive=drum_exclusive, allow_split=allow_split,
+                       split_interval=split_interval, max_pair=max_pair,
+                       drum_max_per_slot=drum_max_per_slot, prefer_same_teacher=prefer_same_teacher,
+                       prefer_continuous=prefer_continuous, progress=progress, order=order)
+    state.run()
+    improvement = state.improve(improve_seconds) if improve_seconds > 0 else None
+
+    if stats is not None:
+        stats["placed"] = count_placed(state.result)
+        record_improvement(stats, improvement)
+
+    unmatched, unused_teachers = state.leftovers()
+    return state.result, unmatched, unused_teachers
+
+
+#貪欲法の割り当て状態（結果・講師の使用状況・生徒ごとのコマ数）
+#match() は run() を1回呼ぶだけ。追加・削除のたびに影響する枠だけ割り当て直すこともできる
+class MatchState:
+    def __init__(self, teachers, students, max_per_instrument=1, drum_exclusive=True,
+                 allow_split=False, split_interval=30, max_pair=2,
+                 drum_max_per_slot=1, prefer_same_teacher=False, prefer_continuous=False, progress=None,
+                 order="availability"):
+        self.max_per_instrument = max_per_instrument
+        self.drum_exclusive = drum_exclusive
+        self.allow_split = allow_split
+        self.split_interval = split_interval
+        self.max_pair = max_pair
+        self.drum_max_per_slot = drum_max_per_slot
+        self.prefer_same_teacher = prefer_same_teacher
+        self.prefer_continuous = prefer_continuous
+        self.progress = progress#progress(段階名, 済んだ人数, 全体の人数)（例外を投げれば中断）
+        self.order = order#"availability": 希望枠の少ない順 / "options": 入れる（講師, 枠）の少ない順
+
+        self.result = defaultdict(list)
+        self.teacher_usage = defaultdict(set)
+        self.student_instr_count = defaultdict(int)
+        self.student_used_slots = defaultdict(set)
+        self.used_by_day = defaultdict(list)#(名前, 日付) ➡ 割り当て済みのコマ（開始順）
+        self.student_teachers = defaultdict(Counter)#(名前, 楽器) ➡ 担当した講師名と回数
+        #枠ごとの組数・ドラムの組数（他楽器の組数はその差）
+        self.slot_pairs = defaultdict(int)
+        self.slot_drums = defaultdict(int)
+
+        self.students = sorted(students, key=lambda s: len(s.availability))
+        #TeacherRoster なら作り置きの分割・索引を使う（索引は共有なので、講師を増減するときにコピーする）
+        self.shared_index = isinstance(teachers, TeacherRoster)
+        if self.shared_index:
+            teachers, self.teacher_index = teachers.prepare(allow_split, split_interval)
+            self.teachers = list(teachers)
+        else:
+            self.teachers = list(teachers)
+            if allow_split:
+                self.teachers = expand_teacher_availability(self.teachers, split_interval)
+            self.teacher_index = build_teacher_index(self.teachers)
+        self.slot_students = None#枠 ➡ その枠を希望する生徒（追加・削除のときだけ作る）
+        self.deadline = None#improve() の終了時刻
+        self.dead_ends = set()#improve() で失敗した入れ直し
+
+    #生徒の希望枠（分割ありなら分割後の枠）
+    def candidate_slots(self, slot):
+        return split_slot(slot, self.split_interval) if self.allow_split else (slot,)
+
+    #入れる（講師, 枠）が1つでもあるか（索引を引くだけで、数は数えない）
+    def has_option(self, student):
+        index = self.teacher_index
+        return any((student.instrument, slot_key) in index
+                   for slot in student.availability for slot_key in self.candidate_slots(slot))
+
+    #割り当て順に並べ替え、探索する生徒（入れる講師が1人以上いる生徒）を返す
+    #数を数える行列は order="options" のときだけ作る
+    def feasible_students(self):
+        if self.order == "options":
+            options = count_options(self.teachers, self.students, self.candidate_slots)
+            ranked = sorted(range(len(self.students)), key=lambda i: options[i])
+            self.students = [self.students[i] for i in ranked]
+            feasible = (options[ranked] > 0).tolist()
+        else:
+            feasible = [self.has_option(student) for student in self.students]
+
+        #入れる講師が1人もいない生徒は探索せずに未割当にする
+        #（日付ごとのシートは result のキーから作るので、希望枠だけは登録しておく）
+        students = []
+        for student, ok in zip(self.students, feasible):
+            if ok:
+                students.append(student)
+            else:
+                for slot in student.availability:
+                    for slot_key in self.candidate_slots(slot):
+                        self.result[slot_key]
+        profiler.count("pruned_students", len(self.students) - len(students))
+        return students
+
+    #students: 並べ替え・絞り込み済みの生徒（省略時は feasible_students() で決める）
+    def run(self, students=None):
+        if students is None:
+            students = self.feasible_students()
+        with profiler.stage("assign_slots(1)"):
+            self.assign_slots(1, students)
+        if self.max_per_instrument > 1:
+            with profiler.stage(f"assign_slots({self.max_per_instrument})"):
+                self.assign_slots(self.max_per_instrument, students)
+
+    def assign_slots(self, target_count, students=None):
+        students = self.students if students is None else students
+        step = max(len(students) // 100, 1)
+        for i, student in enumerate(students):
+            if self.progress is not None and i % step == 0:
+                self.progress(f"assign_slots({target_count})", i, len(students))
+            self.place(student, target_count)
+
+    #1人を1コマ割り当てる（割り当てられたら True）
+    def place(self, student, target_count):
+        key = (student.name, student.instrument)
+        if self.student_instr_count[key] >= target_count:
+            return False
+
+        available = student.availability
+
+        # 時間の近さで並び替える（prefer_continuous が True のときのみ）
+        if self.prefer_continuous and self.student_used_slots[student.name]:
+            available = sorted(available, key=lambda slot: self.time_distance(student.name, slot))
+
+        #2コマ目以降は、まず同じ講師で入る枠を探す
+        if self.prefer_same_teacher and self.student_teachers.get(key):
+            if self.try_place(student, available, self.student_teachers[key]):
+                return True
+        return self.try_place(student, available)
+
+    #available の順に空いている講師を探して割り当てる（only: 講師名を限定するとき）
+    def try_place(self, student, available, only=None):
+        result = self.result
+        counters = profiler.counters()#計測中のみ（枠ごとの判定数・制約ごとの見送り数）
+        #講師は生徒と同じ楽器なので、ドラムかどうかは枠ごとに1回判定すればよい
+        is_drum = student.instrument == "ドラム"
+        for slot in available:
+            for slot_key in self.candidate_slots(slot):
+                if only is None:
+                    result[slot_key]#出力の日付シートは result のキーから作るので、見た枠は登録しておく
+                if counters is not None:
+                    counters["candidate_checks"] += 1
+                pairs = self.slot_pairs[slot_key]
+                if pairs >= self.max_pair:
+                    if counters is not None: counters["skip_max_pair"] += 1
+                    continue
+                drums = self.slot_drums[slot_key]
+
+                #drum_exclusive の有無にかかわらず、ドラムと他楽器は同じ枠に入れない
+                if is_drum:
+                    if pairs - drums > 0:
+                        if counters is not None: counters["skip_drum_exclusive"] += 1
+                        continue
+                    # ドラムの最大人数チェック
+                    if drums >= self.drum_max_per_slot:
+                        if counters is not None: counters["skip_drum_max_per_slot"] += 1
+                        continue
+                elif drums > 0:
+                    if counters is not None: counters["skip_drum_exclusive"] += 1
+                    continue
+
+                candidates = self.teacher_index.get((student.instrument, slot_key), ())
+                if not candidates and counters is not None:
+                    counters["skip_teacher_unavailable"] += 1
+                for teacher in candidates:
+                    if (teacher.name, slot_key) in self.teacher_usage:
+                        if counters is not None: counters["skip_teacher_busy"] += 1
+                        continue
+                    if only is not None and teacher.name not in only:
+                        if counters is not None: counters["skip_other_teacher"] += 1
+                        continue
+                    self.assign(student, teacher, slot_key)
+                    if counters is not None: counters["placements"] += 1
+                    return True
+        return False
+
+    #同じ日に割り当て済みのコマのうち、slot の直前・直後のもの（なければ None）
+    def adjacent_slots(self, name, slot):
+        used = self.used_by_day.get((name, slot.day))
+        if not used:
+            return None, None
+        i = bisect.bisect_left(used, slot)
+        before = used[i - 1] if i > 0 else None
+        after = used[i] if i < len(used) else None
+        return before, after
+
+    #割り当て済みのコマのうち一番近いものとの開始時刻の差（同じ日になければ inf）
+    def time_distance(self, name, slot):
+        before, after = self.adjacent_slots(name, slot)
+        return min((abs(slot.start - used.start) for used in (before, after) if used is not None),
+                   default=float('inf'))
+
+    def assign(self, student, teacher, slot_key):
+        self.result[slot_key].append(Match(student, teacher))
+        self.slot_pairs[slot_key] += 1
+        if teacher.instrument == "ドラム":
+            self.slot_drums[slot_key] += 1
+        self.teacher_usage[(teacher.name, slot_key)] = True
+        key = (student.name, student.instrument)
+        self.student_instr_count[key] += 1
+        self.student_teachers[key][teacher.name] += 1
+        if slot_key not in self.student_used_slots[student.name]:
+            self.student_used_slots[student.name].add(slot_key)
+            bisect.insort(self.used_by_day[(student.name, slot_key.day)], slot_key)
+
+    def unassign(self, slot_key, entry):
+        student, teacher = entry.student, entry.teacher
+        self.result[slot_key].remove(entry)
+        self.slot_pairs[slot_key] -= 1
+        if teacher.instrument == "ドラム":
+            self.slot_drums[slot_key] -= 1
+        del self.teacher_usage[(teacher.name, slot_key)]
+        key = (student.name, student.instrument)
+        self.student_instr_count[key] -= 1
+        self.student_teachers[key][teacher.name] -= 1
+        if not self.student_teachers[key][teacher.name]:
+            del self.student_teachers[key][teacher.name]
+        if not any(m.student.name == student.name for m in self.result[slot_key]):
+            self.student_used_slots[student.name].discard(slot_key)
+            self.used_by_day[(student.name, slot_key.day)].remove(slot_key)
+
+    # ---- 貪欲法のあとの改善（入っている生徒を動かして未割当の生徒を入れる） ----
+
+    #生徒の希望枠（分割後、重複なし）
+    def student_slots(self, student):
+        return list(dict.fromkeys(key for slot in student.availability for key in self.candidate_slots(slot)))
+
+    #slot_key で student を受け持てる空いた講師（組数・ドラムの制約を満たさなければ None）
+    def free_teacher(self, student, slot_key):
+        pairs = self.slot_pairs[slot_key]
+        drums = self.slot_drums[slot_key]
+        if pairs >= self.max_pair:
+            return None
+        if student.instrument == "ドラム":
+            if pairs - drums > 0 or drums >= self.drum_max_per_slot:
+                return None
+        elif drums > 0:
+            return None
+        for teacher in self.teacher_index.get((student.instrument, slot_key), ()):
+            if (teacher.name, slot_key) not in self.teacher_usage:
+                return teacher
+        return None
+
+    #外した割り当てを元の位置に戻す
+    def restore(self, slot_key, entry, position):
+        self.assign(entry.student, entry.teacher, slot_key)
+        matches = self.result[slot_key]
+        matches.insert(position, matches.pop())
+
+    #student を1コマ入れる。空きがなければ、その枠の生徒を1人外して別の枠へ入れ直す（depth 段まで）
+    #うまくいかなければ元に戻して False。moving: この探索で動かしている生徒（同じ生徒を2回動かさない）
+    #一度失敗した (外した生徒, 枠, 入れる楽器, 深さ) は、次に改善するまで試さない（dead_ends）
+    def insert(self, student, depth, moving):
+        slots = [key for key in self.student_slots(student) if key not in self.student_used_slots[student.name]]
+        for slot_key in slots:
+            teacher = self.free_teacher(student, slot_key)
+            if teacher is not None:
+                self.assign(student, teacher, slot_key)
+                return True
+        if depth == 0:
+            return False
+        for slot_key in slots:
+            for position, entry in enumerate(list(self.result.get(slot_key, ()))):
+                if time.perf_counter() > self.deadline:
+                    return False
+                if id(entry.student) in moving:
+                    continue
+                move = (id(entry.student), slot_key, student.instrument, depth)
+                if move in self.dead_ends:
+                    continue
+                profiler.count("improve_moves")
+                self.unassign(slot_key, entry)
+                teacher = self.free_teacher(student, slot_key)
+                if teacher is not None:
+                    self.assign(student, teacher, slot_key)
+                    moving.add(id(entry.student))
+                    if self.insert(entry.student, depth - 1, moving):
+                        return True
+                    moving.discard(id(entry.student))
+                    self.unassign(slot_key, self.result[slot_key][-1])
+                self.restore(slot_key, entry, position)
+                self.dead_ends.add(move)
+        return False
+
+    #未割当の生徒をそれぞれ insert する（1人でも入れば True）
+    #failed: 今の状態で入らなかった (楽器, 空いている希望枠, 深さ)（同じ条件の生徒は試さない）
+    def insert_unmatched(self, depth, failed, timed_out):
+        improved = False
+        for student in self.students:
+            if timed_out():
+                break
+            if self.student_instr_count[(student.name, student.instrument)] >= 1:
                 continue
-
-            # 割り当て済みの時間帯（あれば）を取得
-            used_slots = sorted(list(student_used_slots[student["name"]]))
-            available = student["availability"]
-
-            # 時間の近さで並び替える（prefer_continuous が True のときのみ）
-            if prefer_continuous and used_slots:
-                def time_distance(slot):
-                    date, time = slot
-                    for u_date, u_time in used_slots:
-                        if u_date != date: continue
-                        try:
-                            t1 = datetime.datetime.strptime(time.split('-')[0], "%H:%M")
-                            t2 = datetime.datetime.strptime(u_time.split('-')[0], "%H:%M")
-                            return abs((t1 - t2).total_seconds())
-                        except:
-                            continue
-                    return float('inf')  # 日付が違う場合は遠い
-                available = sorted(available, key=time_distance)
-
-            matched_this_round = False
-            for date, time in available:
-                times = split_time_range(time, split_interval) if allow_split else [time]
-                for split_time in times:
-                    slot_key = (date, split_time)
-                    if len(result[slot_key]) >= max_pair:
+            key = (student.instrument, tuple(slot for slot in self.student_slots(student)
+                                             if slot not in self.student_used_slots[student.name]), depth)
+            if key in failed:
+                continue
+            if self.insert(student, depth, {id(student)}):
+                improved = True
+                failed.clear()
+                self.dead_ends.clear()
+            else:
+                failed.add(key)
+        return improved
+
+    #枠の生徒を1人外し、その枠を希望する未割当の生徒を入れる（外した生徒は depth 段まで別の枠に入れ直す）
+    #割り当てが増えればそのままにする（ドラム1組の枠を他楽器2組に替える、など）。1件でも増えれば True
+    def exchange_slots(self, depth, timed_out):
+        self.build_slot_students()
+        improved = False
+        def waiting(student, slot_key):
+            return (self.student_instr_count[(student.name, student.instrument)] < 1
+                    and slot_key not in self.student_used_slots[student.name])
+        for slot_key in list(self.result):
+            if not any(waiting(student, slot_key) for student in self.slot_students.get(slot_key, ())):
+                continue
+            for position, entry in enumerate(list(self.result[slot_key])):
+                if timed_out():
+                    return improved
+                profiler.count("improve_exchanges")
+                self.unassign(slot_key, entry)
+                removed = (entry.student.name, entry.student.instrument)
+                placed = []
+                #他楽器から入れる（ドラムが先に入ると他楽器が入れなくなるので）
+                for student in sorted(self.slot_students.get(slot_key, ()), key=lambda s: s.instrument == "ドラム"):
+                    if (student.name, student.instrument) == removed or not waiting(student, slot_key):
                         continue
-                    for teacher in teachers:
-                        if teacher["instrument"] != student["instrument"]: continue
-                        if (teacher["name"], slot_key) in teacher_usage: continue
-                        if slot_key not in teacher["availability"]: continue
-
-                        instruments_in_slot = {m["teacher"]["instrument"] for m in result[slot_key]}
-
-                        if drum_exclusive:
-                            if "ドラム" in instruments_in_slot and teacher["instrument"] != "ドラム":
-                                continue
-                            if teacher["instrument"] == "ドラム" and any(inst != "ドラム" for inst in instruments_in_slot):
-                                continue
-                        else:
-                            if teacher["instrument"] == "ドラム" and any(inst != "ドラム" for inst in instruments_in_slot):
-                                continue
-                            if teacher["instrument"] != "ドラム" and "ドラム" in instruments_in_slot:
-                                continue
-
-                        # ドラムの最大人数チェック
-                        if teacher["instrument"] == "ドラム":
-                            drum_count = sum(1 for m in result[slot_key] if m["teacher"]["instrument"] == "ドラム")
-                            if drum_count >= drum_max_per_slot:
-                                continue
-                            #ドラムがなるべく1人になるように割り当てる#
-                                if len(result[slot_key]) < max_pair:
-                                    continue
-
-                        result[slot_key].append({"student": student, "teacher": teacher})
-                        teacher_usage[(teacher["name"], slot_key)] = True
-                        student_instr_count[key] += 1
-                        student_used_slots[student["name"]].add(slot_key)
-                        matched_this_round = True
+                    teacher = self.free_teacher(student, slot_key)
+                    if teacher is not None:
+                        self.assign(student, teacher, slot_key)
+                        placed.append(student)
+                if placed:
+                    lost = self.student_instr_count[(entry.student.name, entry.student.instrument)] < 1
+                    moving = {id(student) for student in placed} | {id(entry.student)}
+                    if self.insert(entry.student, depth, moving) or len(placed) > lost:
+                        improved = True
+                        self.dead_ends.clear()
                         break
-                    if matched_this_round:
-                        break
-                if matched_this_round:
-                    break
-
-    assign_slots(1)
-    if max_per_instrument > 1:
-        assign_slots(max_per_instrument)
-
+                    for _ in placed:
+                        self.unassign(slot_key, self.result[slot_key][-1])
+                self.restore(slot_key, entry, position)
+        return improved
+
+    #未割当の生徒を、時間の許す限り入れ直しで割り当てる（seconds 秒まで、改善がなくなれば終了）
+    #安い手から順に 1人動かす入れ直し ➡ 枠の入れ替え ➡ 2人以上動かす入れ直し を試し、
+    #改善がなくなったら次の手へ（どこかで改善したらまた最初から）。返り値: (増えた割り当て数, かかった秒数)
+    def improve(self, seconds, depth=2):
+        started = time.perf_counter()
+        self.deadline = started + seconds
+        before = count_placed(self.result)
+        reported = started
+        def timed_out():
+            nonlocal reported
+            now = time.perf_counter()
+            if self.progress is not None and now - reported >= 0.1:
+                self.progress("improve", int((now - started) * 1000), int(seconds * 1000))
+                reported = now
+            return now > self.deadline
+
+        failed = set()
+        self.dead_ends = set()
+        moves = [lambda: self.insert_unmatched(1, failed, timed_out),
+                 lambda: self.exchange_slots(depth - 1, timed_out)]
+        moves += [lambda level=level: self.insert_unmatched(level, failed, timed_out) for level in range(2, depth + 1)]
+        step = 0
+        while step < len(moves) and not timed_out():
+            if moves[step]():
+                failed.clear()
+                step = 0
+            else:
+                step += 1
+        elapsed = time.perf_counter() - started
+        gain = count_placed(self.result) - before
+        log(f"[improve] 割り当て {before}件 ➡ {before + gain}件（{elapsed:.2f}秒, {gain / elapsed if elapsed else 0:.1f}件/秒）")
+        return gain, elapsed
+
+    def leftovers(self):
+        return collect_leftovers(self.teachers, self.students, self.teacher_usage,
+                                 self.student_instr_count, self.student_used_slots)
+
+    #現在の (result, unmatched, unused_teachers)（以後の変更の影響を受けないコピー）
+    def snapshot(self):
+        result = defaultdict(list, {slot: list(matches) for slot, matches in self.result.items()})
+        unmatched, unused_teachers = self.leftovers()
+        return result, unmatched, unused_teachers
+
+    # ---- 1人分の追加・削除と、影響する枠だけの割り当て直し ----
+
+    def build_slot_students(self):
+        if self.slot_students is None:
+            self.slot_students = defaultdict(list)
+            for student in self.students:
+                self.index_student(student)
+
+    def index_student(self, student):
+        for slot in student.availability:
+            for slot_key in self.candidate_slots(slot):
+                self.slot_students[slot_key].append(student)
+
+    #空いた（増えた）枠を希望している生徒を、元の順番で割り当て直す
+    def repair(self, slots, instrument=None):
+        affected = set()
+        for slot_key in slots:
+            for student in self.slot_students.get(slot_key, ()):
+                if instrument is None or student.instrument == instrument:
+                    affected.add(id(student))
+        students = [s for s in self.students if id(s) in affected]
+        self.assign_slots(1, students)
+        if self.max_per_instrument > 1:
+            self.assign_slots(self.max_per_instrument, students)
+
+    def add_student(self, student):
+        self.build_slot_students()
+        self.students.append(student)
+        self.index_student(student)
+        self.place(student, 1)
+        if self.max_per_instrument > 1:
+            while self.place(student, self.max_per_instrument):
+                pass
+        return self.student_instr_count[(student.name, student.instrument)]
+
+    #名前（と楽器）が一致する生徒を外し、空いた枠を他の生徒に回す
+    def remove_student(self, name, instrument=None):
+        self.build_slot_students()
+        def target(s):
+            return s.name == name and (instrument is None or s.instrument == instrument)
+        removed = [s for s in self.students if target(s)]
+        freed = []
+        for slot_key in list(self.student_used_slots.get(name, ())):
+            for entry in [m for m in self.result[slot_key] if target(m.student)]:
+                self.unassign(slot_key, entry)
+                freed.append(slot_key)
+        self.students = [s for s in self.students if not target(s)]
+        for s in removed:
+            for slot in s.availability:
+                for slot_key in self.candidate_slots(slot):
+                    self.slot_students[slot_key] = [x for x in self.slot_students[slot_key] if x is not s]
+        self.repair(freed)
+        return removed
+
+    def update_student(self, student):
+        self.remove_student(student.name, student.instrument)
+        return self.add_student(student)
+
+    #共有の索引を書き換えないよう、講師を増減する前に自分用にコピーする
+    def own_index(self):
+        if self.shared_index:
+            self.teacher_index = defaultdict(list, {key: list(v) for key, v in self.teacher_index.items()})
+            self.shared_index = False
+
+    def add_teacher(self, teacher):
+        self.build_slot_students()
+        self.own_index()
+        if self.allow_split:
+            teacher, = expand_teacher_availability([teacher], self.split_interval)
+        self.teachers.append(teacher)
+        for slot_key in dict.fromkeys(teacher.availability):
+            self.teacher_index[(teacher.instrument, slot_key)].append(teacher)
+        self.repair(teacher.availability, teacher.instrument)
+
+    #名前（と楽器）が一致する講師を外し、担当していた生徒を割り当て直す
+    def remove_teacher(self, name, instrument=None):
+        self.build_slot_students()
+        self.own_index()
+        def target(t):
+            return t.name == name and (instrument is None or t.instrument == instrument)
+        removed = [t for t in self.teachers if target(t)]
+        freed = []
+        for teacher in removed:
+            for slot_key in dict.fromkeys(teacher.availability):
+                for entry in [m for m in self.result.get(slot_key, ()) if m.teacher is teacher]:
+                    self.unassign(slot_key, entry)
+                    freed.append(slot_key)
+                candidates = self.teacher_index.get((teacher.instrument, slot_key))
+                if candidates:
+                    candidates[:] = [t for t in candidates if t is not teacher]
+        self.teachers = [t for t in self.teachers if not target(t)]
+        self.repair(freed)
+        return removed
+
+    def update_teacher(self, teacher):
+        self.remove_teacher(teacher.name, teacher.instrument)
+        self.add_teacher(teacher)
+
+
+#improve() の結果を stats に載せる（改善しなかったときは何もしない）
+def record_improvement(stats, improvement):
+    if improvement is not None:
+        gain, elapsed = improvement
+        stats["improve_gain"] = gain
+        stats["improve_seconds"] = round(elapsed, 3)
+        stats["improve_per_second"] = round(gain / elapsed, 1) if elapsed else 0.0
+
+#割り当て済みの生徒（名前, 楽器）の数
+def count_placed(result):
+    return len({(m.student.name, m.student.instrument) for matches in result.values() for m in matches})
+
+#未割当の生徒と空いている講師枠をまとめる
+def collect_leftovers(teachers, students, teacher_usage, student_instr_count, student_used_slots):
+    unmatched = defaultdict(list)
     for student in students:
-        key = (student["name"], student["instrument"])
+        key = (student.name, student.instrument)
         if student_instr_count[key] < 1:
-            unmatched[student["name"].strip()].append(student)
+            unmatched[student.name.strip()].append(student)
 
+    #元の生徒データは書き換えず、他の楽器で使った枠を除いたコピーを載せる（使った枠がなければそのまま）
     for name, entries in unmatched.items():
-        for s in entries:
-            s["availability"] = [slot for slot in s["availability"] if slot not in student_used_slots[s["name"]]]
+        for i, s in enumerate(entries):
+            used = student_used_slots.get(s.name)
+            if used:
+                entries[i] = s._replace(availability=tuple([slot for slot in s.availability if slot not in used]))
 
     unused_teachers = []
     for t in teachers:
-        for d, tslot in t["availability"]:
-            slot_key = (d, tslot)
-            if (t["name"], slot_key) not in teacher_usage:
-                unused_teachers.append({"name": t["name"], "instrument": t["instrument"], "date": d, "time": tslot})
+        for slot in t.availability:
+            if (t.name, slot) not in teacher_usage:
+                unused_teachers.append(OpenSlot(t.name, t.instrument, slot))
+        for entry in t.unparsed:
+            unused_teachers.append(OpenSlot(t.name, t.instrument, None, entry))
 
-    return result, unmatched, unused_teachers
+    return unmatched, unused_teachers
 
 
-#エクセル書き込み
+#エクセル書き込み（書き込み専用モードで1行ずつ流し込む）
+@profiler.timed("write_excel")
 def write_excel(result, unmatched, unused_teachers, path, split_mode=1):
-    wb = Workbook()
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    results = sorted(result.items())
+
     if split_mode in [1, 3]:
-        ws = wb.active
-        ws.title = "マッチング結果"
+        ws = wb.create_sheet(title="マッチング結果")
         ws.append(["名前", "LINE", "パート", "日付", "時間", "講師", "備考"])
-        for (date, time), matches in sorted(result.items(), key=lambda x: (datetime.datetime.strptime(x[0][0], "%m/%d"), x[0][1])):
+        for slot, matches in results:
             for match in matches:
-                s = match["student"]
-                t = match["teacher"]
-                ws.append([s["name"], s["line"], s["instrument"], date, time, f"{t['name']}({t['instrument'][0]})", s["remarks"]])
+                s = match.student
+                t = match.teacher
+                ws.append([s.name, s.line, s.instrument, slot.date, slot.time, f"{t.name}({t.instrument[0]})", s.remarks])
         ws.append([])
         ws.append(["-- 講師未割当 --"])
         for name, entries in unmatched.items():
             for s in entries:
-                times = [f"{d} {t}" for d, t in s["availability"]]
-                ws.append([s["name"], s["line"], s["instrument"], ", ".join(times), "", "", s["remarks"]])
+                times = [str(slot) for slot in s.availability]
+                times += [f"{convert_date(label)} {text}" for label, text in s.unparsed]#読めなかった希望はそのまま
+                ws.append([s.name, s.line, s.instrument, ", ".join(times), "", "", s.remarks])
         ws.append([])
         ws.append(["-- 空いている講師一覧 --"])
         for t in unused_teachers:
-            ws.append([t["name"], "", t["instrument"], t["date"], t["time"], "", ""])
+            if t.slot is None:
+                label, text = t.unparsed
+                ws.append([t.name, "", t.instrument, convert_date(label), text, "", ""])
+            else:
+                ws.append([t.name, "", t.instrument, t.slot.date, t.slot.time, "", ""])
 
     if split_mode in [2, 3]:
-        dates = sorted(set(d for d, _ in result.keys()))
-        for date in dates:
-            safe_title = f"{int(date.split('/')[0])}月{int(date.split('/')[1])}日"
-            ws = wb.create_sheet(title=safe_title)
+        #日付ごとの振り分けは、結果・未割当・空き講師をそれぞれ1回ずつ走査して作る
+        matches_by_day = defaultdict(list)
+        for slot, matches in results:
+            rows = matches_by_day[slot.day]
+            for match in matches:
+                s = match.student
+                t = match.teacher
+                rows.append([s.name, s.line, s.instrument, slot.time, f"{t.name}({t.instrument[0]})", s.remarks])
+        unmatched_by_day = defaultdict(list)
+        for name, entries in unmatched.items():
+            for s in entries:
+                avail = defaultdict(list)
+                for slot in s.availability:
+                    avail[slot.day].append(str(slot))
+                for label, text in s.unparsed:
+                    day = parse_date(label)
+                    if day is not None:
+                        avail[day].append(f"{convert_date(label)} {text}")
+                for day, times in avail.items():
+                    unmatched_by_day[day].append([s.name, s.line, s.instrument, ", ".join(times), "", s.remarks])
+        unused_by_day = defaultdict(list)
+        for t in unused_teachers:
+            if t.slot is None:
+                label, text = t.unparsed
+                day = parse_date(label)
+                if day is not None:
+                    unused_by_day[day].append([t.name, "", t.instrument, text, "", ""])
+            else:
+                unused_by_day[t.slot.day].append([t.name, "", t.instrument, t.slot.time, "", ""])
+
+        for day, rows in matches_by_day.items():
+            ws = wb.create_sheet(title=sheet_title(day))
             ws.append(["名前", "LINE", "パート", "時間", "講師", "備考"])
-            times = sorted(t for d, t in result if d == date)
-            for time in times:
-                for match in result[(date, time)]:
-                    s = match["student"]
-                    t = match["teacher"]
-                    ws.append([s["name"], s["line"], s["instrument"], time, f"{t['name']}({t['instrument'][0]})", s["remarks"]])
+            for row in rows:
+                ws.append(row)
             #割り当てられなかった生徒の処理
             ws.append([])
             ws.append(["-- 未割当生徒 --"])
-            for name, entries in unmatched.items():
-                for s in entries:
-                    avail = [f"{d} {t}" for d, t in s["availability"] if d == date]
-                    if avail:
-                        ws.append([s["name"], s["line"], s["instrument"], ", ".join(avail), "", s["remarks"]])
+            for row in unmatched_by_day.get(day, ()):
+                ws.append(row)
             #空いてる時間のある講師
             ws.append([])
             ws.append(["-- 空いている講師一覧 --"])
-            for t in unused_teachers:
-                if t["date"] == date:
-                    ws.append([t["name"], "", t["instrument"], t["time"], "", ""])
+            for row in unused_by_day.get(day, ()):
+                ws.append(row)
 
+    if not wb.worksheets:
+        wb.create_sheet(title="マッチング結果")
     wb.save(path)
     log(f"Excel出力完了: {path}")
 
 
-#tkGUI処理
-class MatchApp:
-    def __init__(self, root):
-        self.root = root
-        self.teacher_file = None
-        self.student_file = None
-        self.max_teacher_slot = IntVar(value=1)
-        self.max_pair = IntVar(value=2)
-        self.drum_exclusive = BooleanVar(value=False)
-        self.output_excel = BooleanVar(value=True)
-        self.output_pdf = BooleanVar(value=True)
-        self.max_slots_per_instrument = IntVar(value=1)
-        self.enable_split = BooleanVar(value=False)
-        self.split_minutes = IntVar(value=30)
-        self.output_mode = IntVar(value=1)
-        self.prefer_same_teacher = BooleanVar(value=False)
-        self.drum_max_per_slot = IntVar(value=1)
-        self.prefer_continuous = BooleanVar(value=False)
-
-
-        root.title("講習マッチング")
-        root.geometry("520x600")
-
-        tk.Button(root, text="講師ファイルを選択", command=self.load_teacher).pack(pady=5)
-        tk.Button(root, text="生徒ファイルを選択", command=self.load_student).pack(pady=5)
-
-        tk.Label(root, text="① 講師1人につき1コマの生徒人数").pack()
-        tk.Spinbox(root, from_=1, to=5, textvariable=self.max_teacher_slot, width=5).pack()
-
-        tk.Label(root, text="② 同時間帯に最大組数").pack()
-        tk.Spinbox(root, from_=1, to=5, textvariable=self.max_pair, width=5).pack()
-
-        tk.Checkbutton(root, text="③ ドラムは他楽器と同時不可", variable=self.drum_exclusive).pack()
-
-        tk.Label(root, text="④ ドラムの1コマ最大組数").pack()
-        tk.Spinbox(root, from_=1, to=5, textvariable=self.drum_max_per_slot, width=5).pack()
-
-        tk.Label(root, text="⑤ 楽器ごとに最大何枠まで許可").pack()
-        tk.Spinbox(root, from_=1, to=10, textvariable=self.max_slots_per_instrument, width=5).pack()
-
-        tk.Checkbutton(root, text="⑥ 割り当て失敗時、時間枠を分割して再試行", variable=self.enable_split).pack()
-        tk.Label(root, text="分割単位（分）").pack()
-        tk.Radiobutton(root, text="30分ごと", variable=self.split_minutes, value=30).pack()
-        tk.Radiobutton(root, text="20分ごと", variable=self.split_minutes, value=20).pack()
-
-        tk.Checkbutton(root, text="⑦ 2枠目もできるだけ同じ講師にする", variable=self.prefer_same_teacher).pack()
-        tk.Checkbutton(root, text="⑧ 講習会のコマをできるだけ連続にする", variable=self.prefer_continuous).pack()
-
-        tk.Label(root, text="<出力形式>").pack()
-        tk.Radiobutton(root, text="1シートにまとめる", variable=self.output_mode, value=1).pack()
-        tk.Radiobutton(root, text="日付ごとに分ける", variable=self.output_mode, value=2).pack()
-        tk.Radiobutton(root, text="両方出力", variable=self.output_mode, value=3).pack()
-
-        tk.Checkbutton(root, text="Excelで出力", variable=self.output_excel).pack()
-
-        tk.Button(root, text="マッチング開始", command=self.run, bg="lightgreen").pack(pady=20)
-
-    def load_teacher(self):
-        path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx")])
-        if path:
-            self.teacher_file = path
-            messagebox.showinfo("読み込み成功", "講師ファイルを読み込みました")
-            log(f"講師ファイル読み込み: {path}")
-
-    def load_student(self):
-        path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx")])
-        if path:
-            self.student_file = path
-            messagebox.showinfo("読み込み成功", "生徒ファイルを読み込みました")
-            log(f"生徒ファイル読み込み: {path}")
-
-    def run(self):
-        if not self.teacher_file or not self.student_file:
-            messagebox.showwarning("エラー", "両ファイルを選択してください")
-            return
-        try:
-            teachers = parse_people(pd.read_excel(self.teacher_file))
-            students = parse_people(pd.read_excel(self.student_file))
-
-            result, unmatched, unused_teachers = match(
-                teachers,
-                students,
-                max_per_instrument=self.max_slots_per_instrument.get(),
-                drum_exclusive=self.drum_exclusive.get(),
-                allow_split=self.enable_split.get(),
-                split_interval=self.split_minutes.get(),
-                max_pair=self.max_pair.get(),
-                prefer_same_teacher=self.prefer_same_teacher.get(),
-                prefer_continuous=self.prefer_continuous.get()
-            )
-
-            now = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-
-            if self.output_excel.get():
-                path = filedialog.asksaveasfilename(defaultextension=".xlsx", initialfile=f"講習会マッチング表_{now}.xlsx")
-                if path:
-                    write_excel(result, unmatched, unused_teachers, path, self.output_mode.get())
-                    messagebox.showinfo("出力完了", "Excelファイルを出力しました")
-
-        except Exception as e:
-            log(f"エラー: {str(e)}")
-            messagebox.showerror("エラー", str(e))
-
-#アプリ起動
+#コマンドライン実行（GUI を使わずにマッチングして出力する）
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="講習マッチング（コマンドライン実行）")
+    parser.add_argument("teacher_file", help="講師ファイル（.xlsx）")
+    parser.add_argument("student_file", help="生徒ファイル（.xlsx）")
+    parser.add_argument("-o", "--output", help="出力先（省略時は 講習会マッチング表_日時.xlsx など）")
+    parser.add_argument("--format", choices=["xlsx", "csv", "jsonl", "parquet"], default=None,
+                        help="出力形式（省略時は出力先の拡張子から決める。parquet は pyarrow が必要）")
+    parser.add_argument("--output-mode", type=int, choices=[1, 2, 3], default=1,
+                        help="1: 1シートにまとめる / 2: 日付ごとに分ける / 3: 両方（xlsx のみ）")
+    parser.add_argument("--max-per-instrument", type=int, default=1, help="楽器ごとに最大何枠まで許可")
+    parser.add_argument("--max-pair", type=int, default=2, help="同時間帯に最大組数")
+    parser.add_argument("--drum-exclusive", action=argparse.BooleanOptionalAction, default=True,
+                        help="ドラムは他楽器と同時不可")
+    parser.add_argument("--drum-max-per-slot", type=int, default=1, help="ドラムの1コマ最大組数")
+    parser.add_argument("--allow-split", action="store_true", help="時間枠を分割して割り当てる")
+    parser.add_argument("--split-interval", type=int, default=30, help="分割単位（分）")
+    parser.add_argument("--prefer-same-teacher", action="store_true", help="2枠目もできるだけ同じ講師にする（flow では使わない）")
+    parser.add_argument("--prefer-continuous", action="store_true", help="コマをできるだけ連続にする（flow では使わない）")
+    parser.add_argument("--engine", choices=ENGINES, default="greedy",
+                        help="割り当て方式（parallel: 独立したまとまりごとに並列実行、結果は greedy と同じ）")
+    parser.add_argument("--workers", type=int, default=None, help="parallel の並列数")
+    parser.add_argument("--improve", type=float, default=0, metavar="SECONDS",
+                        help="貪欲法のあと、入っている生徒を動かして未割当の生徒を入れる時間（秒、flow では使わない）")
+    parser.add_argument("--order", choices=ORDERS, default="availability",
+                        help="割り当て順（availability: 希望枠の少ない順 / options: 入れる講師・枠の少ない順、flow では使わない）")
+    parser.add_argument("--log-level", default=None, help="ログレベル（DEBUG で行ごとの詳細ログ）")
+    parser.add_argument("--no-cache", action="store_true", help="キャッシュを使わずに読み込み・マッチングし直す")
+    parser.add_argument("--cache-dir", default=None, help="キャッシュの保存場所（省略時は SHINKAN_CACHE_DIR か .shinkan_cache）")
+    parser.add_argument("--profile", metavar="JSON",
+                        help="段階ごとの時間と割り当てのカウンタを JSON で保存するパス（計測のためキャッシュは使わない）")
+    args = parser.parse_args(argv)
+
+    setup_logging(args.log_level)
+    if args.profile:
+        profiler.start()
+    from export import FORMATS, available_formats, export, format_for
+    fmt = args.format or (format_for(args.output) if args.output else "xlsx")
+    if fmt not in available_formats():
+        parser.error(f"{fmt} で出力するには pyarrow が必要です")
+    output = args.output or f"講習会マッチング表_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}{FORMATS[fmt][0]}"
+
+    params = dict(
+        max_per_instrument=args.max_per_instrument,
+        drum_exclusive=args.drum_exclusive,
+        allow_split=args.allow_split,
+        split_interval=args.split_interval,
+        max_pair=args.max_pair,
+        drum_max_per_slot=args.drum_max_per_slot,
+        prefer_same_teacher=args.prefer_same_teacher,
+        prefer_continuous=args.prefer_continuous,
+        engine=args.engine,
+        order=args.order,
+        workers=args.workers,
+        improve_seconds=args.improve,
+    )
+    #計測するときはキャッシュを使わない（キャッシュから読むと読み込み・マッチングの計測が残らない）
+    if args.no_cache or args.profile:
+        teachers = read_people(args.teacher_file)
+        students = read_people(args.student_file)
+        stats = {}
+        result, unmatched, unused_teachers = match(teachers, students, stats=stats, **params)
+    else:
+        from cache import Cache, cached_match
+        result, unmatched, unused_teachers, stats = cached_match(
+            args.teacher_file, args.student_file, cache=Cache(args.cache_dir), **params)
+    export(result, unmatched, unused_teachers, output, fmt, args.output_mode)
+
+    unmatched_count = sum(len(entries) for entries in unmatched.values())
+    print(f"割り当て: {stats['placed']}件 / 未割当: {unmatched_count}件 / 空き講師枠: {len(unused_teachers)}件")
+    if "gain" in stats:
+        print(f"貪欲法との差: {stats['gain']:+d}件")
+    if "improve_gain" in stats:
+        print(f"改善: {stats['improve_gain']:+d}件（{stats['improve_seconds']}秒, {stats['improve_per_second']}件/秒）")
+    print(f"出力: {output}")
+    if args.profile:
+        profiler.stop().save(args.profile)
+        print(f"プロファイル: {args.profile}")
+    return 0
+
+
+#引数があればコマンドライン、なければ GUI を起動
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = MatchApp(root)
-    root.mainloop()
+    if len(sys.argv) > 1:
+        sys.exit(main())
+    from match_gui import run_gui
+    run_gui()
@@ -0,0 +1,154 @@
+import argparse
+import datetime
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+
+from MatchShinkan import parse_people, read_people, match, write_excel, setup_logging, INSTRUMENTS
+
+DRUM = "ドラム"
+
+
+#"ギター:3,ベース:2" ➡ {"ギター": 3, "ベース": 2}
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition(":")
+        name = name.strip()
+        if name not in INSTRUMENTS or name == DRUM:
+            raise ValueError(f"楽器名が不正です: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+#parse_people が読む形（convert.py の出力と同じ列順）の名簿を作る
+#slot_density: 1日の各1時間枠が空いている確率 / drum_share: ドラムを選ぶ人の割合
+def make_roster(count, dates=10, slot_density=0.3, mix=None, drum_share=0.2,
+                max_instruments=2, hours=(9, 21), prefix="S", seed=0):
+    rnd = random.Random(seed)
+    mix = mix or {"ギター": 3, "ベース": 2, "キーボード": 1, "その他": 1}
+    names, weights = list(mix), list(mix.values())
+    start = datetime.date(2000, 6, 1)
+    date_columns = [f"{d.month}/{d.day}" for d in (start + datetime.timedelta(days=i) for i in range(dates))]
+
+    rows = []
+    for i in range(count):
+        row = {"": "", "メールアドレス": f"{prefix.lower()}{i}@example.com", "名前": f"{prefix}{i:05}", "LINE名": f"line_{prefix}{i}"}
+        for col in date_columns:
+            times = [f"{h:02}:00-{h + 1:02}:00" for h in range(*hours) if rnd.random() < slot_density]
+            row[col] = ", ".join(times) if times else None
+        instruments = set()
+        if rnd.random() < drum_share:
+            instruments.add(DRUM)
+        target = min(rnd.randint(1, max_instruments), len(names) + len(instruments))
+        while len(instruments) < target:
+            instruments.add(rnd.choices(names, weights)[0])
+        row["希望楽器"] = "\n".join(sorted(instruments))
+        row["備考"] = None
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+#n 回実行して最短時間を返す
+def best_of(repeat, func):
+    best, value = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, value
+
+
+def run_benchmark(args):
+    mix = parse_mix(args.instruments)
+    teacher_df = make_roster(args.teachers, args.dates, args.teacher_density, mix, args.drum_share,
+                             max_instruments=1, prefix="T", seed=args.seed + 1)
+    student_df = make_roster(args.students, args.dates, args.slot_density, mix, args.drum_share,
+                             max_instruments=args.max_instruments, prefix="S", seed=args.seed)
+    report = {"config": vars(args), "stages": []}
+
+    def record(stage, seconds, items, **extra):
+        entry = {"stage": stage, "seconds": round(seconds, 4), "items": items,
+                 "per_second": round(items / seconds, 1) if seconds > 0 else None, **extra}
+        report["stages"].append(entry)
+        cols = " ".join(f"{k}={v}" for k, v in extra.items())
+        print(f"{stage:<48} {seconds:8.3f}s {items:>8}件 {entry['per_second'] or 0:>12.1f}件/s {cols}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        #読み込み（--xlsx のときだけ実ファイル経由）
+        if args.xlsx:
+            teacher_path, student_path = os.path.join(tmp, "teachers.xlsx"), os.path.join(tmp, "students.xlsx")
+            teacher_df.to_excel(teacher_path, index=False)
+            student_df.to_excel(student_path, index=False)
+            seconds, student_df = best_of(args.repeat, lambda: pd.read_excel(student_path))
+            record("read_excel(students)", seconds, len(student_df))
+            seconds, _ = best_of(args.repeat, lambda: read_people(student_path))
+            record("read_people(students)", seconds, len(student_df))
+            teacher_df = pd.read_excel(teacher_path)
+
+        seconds, students = best_of(args.repeat, lambda: parse_people(student_df))
+        record("parse_people(students)", seconds, len(student_df))
+        seconds, teachers = best_of(args.repeat, lambda: parse_people(teacher_df))
+        record("parse_people(teachers)", seconds, len(teacher_df))
+
+        last = None
+        for engine, split, continuous, per_instrument in itertools.product(
+                args.engines, (False, True), (False, True), sorted({1, args.max_per_instrument})):
+            if engine == "flow" and continuous:
+                continue
+            stats = {}
+            seconds, last = best_of(args.repeat, lambda: match(
+                teachers, students,
+                max_per_instrument=per_instrument, allow_split=split, split_interval=args.split_interval,
+                prefer_continuous=continuous, max_pair=args.max_pair, engine=engine, stats=stats))
+            coverage = stats["placed"] / len(students) if students else 0
+            record(f"match({engine}, split={split:d}, cont={continuous:d}, max={per_instrument})",
+                   seconds, len(students), placed=stats["placed"], coverage=round(coverage, 3))
+
+        result, unmatched, unused_teachers = last
+        rows = sum(len(m) for m in result.values()) + sum(len(e) for e in unmatched.values()) + len(unused_teachers)
+        for mode in (1, 3):
+            path = os.path.join(tmp, f"out{mode}.xlsx")
+            seconds, _ = best_of(args.repeat, lambda: write_excel(result, unmatched, unused_teachers, path, mode))
+            record(f"write_excel(mode={mode})", seconds, rows)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+#ベンチマーク（合成データで parse_people / match / write_excel の時間を測る）
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="講習マッチングのベンチマーク")
+    parser.add_argument("--students", type=int, default=500, help="生徒の人数")
+    parser.add_argument("--teachers", type=int, default=40, help="講師の人数")
+    parser.add_argument("--dates", type=int, default=10, help="日数")
+    parser.add_argument("--slot-density", type=float, default=0.3, help="生徒の1時間枠ごとの空き率")
+    parser.add_argument("--teacher-density", type=float, default=0.5, help="講師の1時間枠ごとの空き率")
+    parser.add_argument("--instruments", default="ギター:3,ベース:2,キーボード:1,その他:1", help="楽器の比率（ドラム以外）")
+    parser.add_argument("--drum-share", type=float, default=0.2, help="ドラムを選ぶ人の割合")
+    parser.add_argument("--max-instruments", type=int, default=2, help="生徒1人の最大希望楽器数")
+    parser.add_argument("--max-per-instrument", type=int, default=2, help="max_per_instrument の比較値")
+    parser.add_argument("--max-pair", type=int, default=2)
+    parser.add_argument("--split-interval", type=int, default=30)
+    parser.add_argument("--engines", default="greedy", help="比較する方式（例: greedy,flow）")
+    parser.add_argument("--repeat", type=int, default=3, help="各計測の繰り返し回数（最短値を採用）")
+    parser.add_argument("--xlsx", action="store_true", help="xlsx に書き出して read_excel も計測する")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="結果を JSON で保存するパス")
+    args = parser.parse_args(argv)
+    args.engines = [e.strip() for e in args.engines.split(",")]
+
+    setup_logging("WARNING")
+    run_benchmark(args)
+
+
+if __name__ == "__main__":
+    main()
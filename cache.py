@@ -0,0 +1,131 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import tempfile
+
+from MatchShinkan import log, read_people, match
+
+CACHE_DIR = os.environ.get("SHINKAN_CACHE_DIR", ".shinkan_cache")#保存場所
+MAX_BYTES = 256 * 1024 * 1024#これを超えたら古いものから消す
+CACHE_VERSION = 4#保存する形が変わったら上げる（古いキャッシュは使われなくなる）
+
+
+#ファイルの中身のハッシュ（同じ中身なら名前や更新日時が違っても同じ値）
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def make_key(kind, **parts):
+    text = json.dumps({"kind": kind, "version": CACHE_VERSION, **parts}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+#ディスク上のキャッシュ（1件1ファイルの pickle）
+class Cache:
+    def __init__(self, directory=None, max_bytes=MAX_BYTES):
+        self.directory = directory or CACHE_DIR
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    #見つからない・読めない場合は None
+    def load(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log(f"[cache] 読み込み失敗のため破棄: {path} ({e})")
+            self.discard(path)
+            return None
+        os.utime(path)#最近使ったものは消されにくくする
+        return value
+
+    #一時ファイルに書いてから置き換える（途中で止まっても壊れたファイルを残さない）
+    def store(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            self.discard(tmp)
+            raise
+        self.evict()
+
+    def discard(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    #合計サイズが上限を超えたら、使われていない順に消す
+    def evict(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".pkl"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.discard(path)
+            total -= size
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith((".pkl", ".tmp")):
+                    self.discard(os.path.join(self.directory, name))
+
+
+#read_people の結果をファイルの中身のハッシュで保存する
+def cached_people(path, sheet=0, cache=None, digest=None, progress=None):
+    cache = cache or Cache()
+    key = make_key("people", digest=digest or file_digest(path), sheet=sheet)
+    people = cache.load(key)
+    if people is None:
+        people = read_people(path, sheet, progress=progress)
+        cache.store(key, people)
+    else:
+        log(f"[cache] 解析済みの名簿を使用: {path}")
+    return people
+
+
+#読み込み ➡ match() をまとめてキャッシュする（キーは両ファイルの中身と match() の設定すべて）
+#返り値: (result, unmatched, unused_teachers, stats)
+#progress は match() に、teacher_progress / student_progress はそれぞれの読み込みに渡す
+def cached_match(teacher_file, student_file, cache=None, progress=None,
+                 teacher_progress=None, student_progress=None, **params):
+    cache = cache or Cache()
+    #省略された設定も既定値で埋めてからキーにする（同じ設定なら書き方によらず同じキー）
+    defaults = {name: p.default for name, p in inspect.signature(match).parameters.items()
+                if p.default is not inspect.Parameter.empty and name not in ("stats", "progress")}
+    params = {**defaults, **params}
+    teacher_digest, student_digest = file_digest(teacher_file), file_digest(student_file)
+    #workers は結果に影響しないのでキーに含めない
+    key = make_key("match", teachers=teacher_digest, students=student_digest,
+                   params={k: v for k, v in params.items() if k != "workers"})
+    cached = cache.load(key)
+    if cached is not None:
+        log(f"[cache] マッチング結果を使用: {teacher_file}, {student_file}")
+        return cached
+
+    teachers = cached_people(teacher_file, cache=cache, digest=teacher_digest, progress=teacher_progress)
+    students = cached_people(student_file, cache=cache, digest=student_digest, progress=student_progress)
+    stats = {}
+    result, unmatched, unused_teachers = match(teachers, students, stats=stats, progress=progress, **params)
+    value = (result, unmatched, unused_teachers, stats)
+    cache.store(key, value)
+    return value
@@ -1,30 +1,13 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
+import multiprocessing
+import os
 import pandas as pd
-import re
-from openpyxl import load_workbook
-from collections import OrderedDict
-
-def convert_date(val):
-    if pd.isna(val): return ""
-    s = str(val).strip()
-    match = re.search(r"(?:\d{4}[年/]?)?\s*(\d{1,2})[月/](\d{1,2})", s)
-    if match: return f"{int(match.group(1))}/{int(match.group(2))}"
-    return s
-
-def convert_time_list(val):
-    if pd.isna(val): return []
-    times = str(val).replace("，", ",").split(",")
-    result = []
-    for t in times:
-        t = t.strip().translate(str.maketrans("０１２３４５６７８９：－〜～", "0123456789:-~~"))
-        if re.fullmatch(r"\d{1,2}:\d{2}-\d{1,2}:\d{2}", t):
-            result.append(t)
-        elif m := re.match(r"^(\d{1,2})[-~](\d{1,2})$", t):
-            result.append(f"{int(m.group(1)):02}:00-{int(m.group(2)):02}:00")
-        elif m := re.match(r"^(\d{1,2})時[-~〜](\d{1,2})時$", t):
-            result.append(f"{int(m.group(1)):02}:00-{int(m.group(2)):02}:00")
-    return result
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from timeslot import convert_date, convert_time_list
+from reader import list_sheets, iter_frames
 
 def col_letter_to_index(letter):
     if not letter: return None
@@ -42,77 +25,174 @@ def parse_column_ranges(text):
             cols.append(col_letter_to_index(part))
     return sorted(set(cols))
 
-def process(file, sheet, name_col, line_col, mail_col, inst_col, date_cols):
-    df = pd.read_excel(file, sheet_name=sheet, header=None)
-
+#1行目（日付行）以外の各行を列ごとにまとめて正規化する
+#records: 1行1件（key=名前, mail, line, inst, remarks） / schedule: 1時間帯1件（key, date, time）
+def extract_rows(df, name_col, line_col, mail_col, inst_col, date_cols):
     # 日付行（1行目）の変換
     date_map = {}
     for col in date_cols:
         date = convert_date(df.iloc[0, col])
         if date: date_map[col] = date
 
-    merged = OrderedDict()
-    for i in range(1, len(df)):  # 全行処理（1行目は日付行）
-        name = df.iloc[i, name_col] if name_col is not None else ""
-        if not str(name).strip(): continue  # 名前が空欄ならスキップ
-        key = str(name).strip()
-
-        line = df.iloc[i, line_col] if line_col is not None else ""
-        mail = df.iloc[i, mail_col] if mail_col is not None else ""
-        inst = df.iloc[i, inst_col] if inst_col is not None else ""
-
-        # 備考（A列と指定列・日付列を除外した列から収集、A列＝col0は除く）
-        remarks = []
-        for j in range(1, df.shape[1]):
-            if j not in [name_col, line_col, mail_col, inst_col] + date_cols:
-                v = df.iloc[i, j]
-                if pd.notna(v): remarks.append(str(v).strip())
-        remarks_text = " / ".join(remarks)
-
-        # 初回エントリ
-        if key not in merged:
-            merged[key] = {
-                "メールアドレス": mail,
-                "名前": key,
-                "LINE名": line,
-                "希望楽器": inst,
-                "備考": remarks_text,
-                "スケジュール": {date: set() for date in date_map.values()}
-            }
-
-        person = merged[key]
-
-        # 備考は常に上書き（後の方を優先）
-        if remarks_text:
-            person["備考"] = remarks_text
-        if pd.notna(mail): person["メールアドレス"] = mail
-        if pd.notna(line): person["LINE名"] = line
-        if pd.notna(inst): person["希望楽器"] = inst
-
-        # 時間のマージ（重複を避ける）
-        for col, date in date_map.items():
-            times = convert_time_list(df.iloc[i, col])
-            person["スケジュール"][date].update(times)
-
-    # 出力行を構築
-    all_dates = sorted(list(date_map.values()))
-    rows = []
-    for person in merged.values():
-        row = {
-            "メールアドレス": person["メールアドレス"],
-            "名前": person["名前"],
-            "LINE名": person["LINE名"],
-            "希望楽器": person["希望楽器"],
-            "備考": person["備考"]
-        }
-        for date in all_dates:
-            times = sorted(person["スケジュール"][date])
-            row[date] = ", ".join(times)
-        rows.append(row)
-
-    df_out = pd.DataFrame(rows)
+    body = df.iloc[1:].reset_index(drop=True)
+    def column(col):
+        return body.iloc[:, col] if col is not None else pd.Series("", index=body.index, dtype=object)
+
+    keys = column(name_col).map(str).str.strip()
+    keep = (keys != "").to_numpy()  # 名前が空欄ならスキップ
+
+    # 備考（A列と指定列・日付列を除外した列から収集、A列＝col0は除く）
+    skip = {name_col, line_col, mail_col, inst_col, *date_cols}
+    remark_cols = [j for j in range(1, body.shape[1]) if j not in skip]
+    remarks = pd.Series("", index=body.index, dtype=object)
+    if remark_cols:
+        width = len(remark_cols)
+        cells = pd.Series(body.iloc[:, remark_cols].to_numpy(dtype=object).ravel())
+        cells = cells[cells.notna()].map(str).str.strip()
+        joined = defaultdict(list)
+        for i, v in zip((cells.index // width).tolist(), cells.tolist()):
+            joined[i].append(v)
+        remarks[list(joined)] = [" / ".join(v) for v in joined.values()]
+
+    records = pd.DataFrame({
+        "key": keys,
+        "mail": column(mail_col),
+        "line": column(line_col),
+        "inst": column(inst_col),
+        "remarks": remarks
+    })[keep]
+
+    # 時間帯は同じ文字列が多いので、値の種類ごとに1回だけ正規化する
+    cols = list(date_map)
+    width = max(len(cols), 1)
+    cells = pd.Series(body.iloc[:, cols].to_numpy(dtype=object).ravel(), dtype=object)
+    cells = cells[cells.notna()]
+    lookup = {v: convert_time_list(v) for v in pd.unique(cells)}
+    times = cells.map(lookup).explode().dropna()
+    rows = times.index.to_numpy(dtype=int) // width
+    col_dates = [date_map[c] for c in cols]
+    schedule = pd.DataFrame({
+        "key": keys.to_numpy()[rows],
+        "date": [col_dates[i % width] for i in times.index],
+        "time": times.to_numpy()
+    })[keep[rows]]
+    return records, schedule, list(date_map.values())
+
+
+#同じ名前の行をまとめて出力用の表にする
+#連絡先・楽器は空欄でない最後の値、備考は空でない最後の値、時間帯は重複を除いて合算
+def merge_people(records, schedule, dates):
+    grouped = records.groupby("key", sort=False)
+    merged = grouped[["mail", "line", "inst"]].last()
+    remarks = records["remarks"].where(records["remarks"] != "").groupby(records["key"], sort=False).last().fillna("")
+
+    schedule = schedule.drop_duplicates().sort_values("time", kind="stable")
+    joined = defaultdict(list)
+    for key, date, time in zip(schedule["key"].tolist(), schedule["date"].tolist(), schedule["time"].tolist()):
+        joined[(key, date)].append(time)
+    joined = {k: ", ".join(v) for k, v in joined.items()}
+
+    all_dates = sorted(dates)
+    df_out = pd.DataFrame({
+        "メールアドレス": merged["mail"].to_numpy(),
+        "名前": merged.index.to_numpy(),
+        "LINE名": merged["line"].to_numpy(),
+        "希望楽器": merged["inst"].to_numpy(),
+        "備考": remarks.reindex(merged.index).to_numpy()
+    })
+    for date in dict.fromkeys(all_dates):
+        df_out[date] = [joined.get((key, date), "") for key in merged.index]
     df_out = df_out[["メールアドレス", "名前", "LINE名"] + all_dates + ["希望楽器", "備考"]]
     df_out.insert(0, "", "")  # A列空白
+    return df_out
+
+
+#シートを chunksize 行ずつ読みながら extract_rows する（シート全体を DataFrame にしない）
+def extract_file(file, sheet, name_col, line_col, mail_col, inst_col, date_cols, chunksize=5000):
+    used = [c for c in (name_col, line_col, mail_col, inst_col, *date_cols) if c is not None]
+    need = max(used) + 1 if used else 0
+    header = None
+    records, schedules, dates = [], [], []
+    for chunk in iter_frames(file, sheet, header=None, chunksize=chunksize):
+        chunk = chunk.reindex(columns=range(max(chunk.shape[1], need)))
+        if header is None:
+            header = chunk.iloc[:1]  #日付行は最初のチャンクの1行目
+        else:
+            #2つ目以降のチャンクにも日付行を付けて同じ形にする
+            chunk = pd.concat([header.reindex(columns=chunk.columns), chunk], ignore_index=True)
+        r, sc, dates = extract_rows(chunk, name_col, line_col, mail_col, inst_col, date_cols)
+        records.append(r)
+        schedules.append(sc)
+    if header is None:
+        raise ValueError(f"シートが空です: {file} [{sheet}]")
+    return pd.concat(records, ignore_index=True), pd.concat(schedules, ignore_index=True), dates
+
+
+def convert_file(file, sheet, name_col, line_col, mail_col, inst_col, date_cols, chunksize=5000):
+    return merge_people(*extract_file(file, sheet, name_col, line_col, mail_col, inst_col, date_cols, chunksize))
+
+
+#列指定 {"name": "B", "line": "C", "mail": "A", "inst": "D", "dates": "E-G,J"} ➡ extract_rows の引数
+def parse_mapping(spec):
+    def col(key):
+        return col_letter_to_index(spec[key]) if spec.get(key) else None
+    if col("name") is None:
+        raise ValueError(f"名前の列が指定されていません: {spec}")
+    return col("name"), col("line"), col("mail"), col("inst"), parse_column_ranges(spec.get("dates", ""))
+
+
+#ディレクトリなら中の .xlsx（Excel の一時ファイルは除く）、ファイルならそのまま
+def collect_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, f) for f in os.listdir(path)
+                                if f.lower().endswith(".xlsx") and not f.startswith("~$")))
+        else:
+            files.append(path)
+    return files
+
+
+#変換するシートの一覧（ファイル, シート, 列指定）
+#mappings のキー: "ファイル名:シート名" ＞ "シート名" ＞ "*"（既定）の順に探し、見つからないシートは読まない
+def plan_jobs(files, mappings):
+    jobs = []
+    for file in files:
+        base = os.path.basename(file)
+        for sheet in list_sheets(file):
+            spec = mappings.get(f"{base}:{sheet}") or mappings.get(sheet) or mappings.get("*")
+            if spec:
+                jobs.append((file, sheet, *parse_mapping(spec)))
+    return jobs
+
+
+def extract_job(job):
+    return extract_file(*job)
+
+
+#複数ファイル・複数シートをプロセスプールで並列に読み、1つの表にまとめる
+#同じ名前の人は process と同じ規則でまとめる（ファイル・シートの順で後のものが優先）
+def convert_batch(paths, mappings, workers=None):
+    jobs = plan_jobs(collect_files(paths), mappings)
+    if not jobs:
+        raise ValueError("変換するシートがありません")
+    if workers == 1 or len(jobs) == 1:
+        parts = [extract_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(extract_job, jobs))
+    records = pd.concat([p[0] for p in parts], ignore_index=True)
+    schedule = pd.concat([p[1] for p in parts], ignore_index=True)
+    #日付列は1ファイル内と同じになるよう、各シートで一番多く出てきた数だけ残す
+    dates = []
+    for part in parts:
+        for date in dict.fromkeys(part[2]):
+            dates.extend([date] * (part[2].count(date) - dates.count(date)))
+    return merge_people(records, schedule, dates)
+
+
+def process(file, sheet, name_col, line_col, mail_col, inst_col, date_cols):
+    df_out = convert_file(file, sheet, name_col, line_col, mail_col, inst_col, date_cols)
 
     save_path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel", "*.xlsx")])
     if save_path:
@@ -131,9 +211,8 @@ def start_gui():
         entry_file.insert(0, path)
 
         try:
-            wb = load_workbook(path)
             sheet_names.clear()
-            sheet_names.extend(wb.sheetnames)
+            sheet_names.extend(list_sheets(path))
             dropdown_menu["menu"].delete(0, "end")
             for s in sheet_names:
                 dropdown_menu["menu"].add_command(label=s, command=tk._setit(sheet_var, s))
@@ -189,4 +268,33 @@ def start_gui():
     tk.Button(root, text="実行", command=run, bg="lightgreen").grid(row=7, column=1, pady=10)
     root.mainloop()
 
-start_gui()
+#一括変換（引数なしなら GUI）
+def main(argv=None):
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="フォームの回答（複数ファイル・複数シート）を1つの表にまとめる")
+    parser.add_argument("inputs", nargs="+", help="Excelファイルまたはディレクトリ")
+    parser.add_argument("-m", "--mapping", required=True,
+                        help='列指定の JSON（ファイルパスまたは文字列）例: {"*": {"name": "B", "line": "C", "mail": "A", "inst": "D", "dates": "E-G"}}')
+    parser.add_argument("-o", "--output", default="統合名簿.xlsx", help="出力先")
+    parser.add_argument("--workers", type=int, default=None, help="並列数")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.mapping):
+        with open(args.mapping, encoding="utf-8") as f:
+            mappings = json.load(f)
+    else:
+        mappings = json.loads(args.mapping)
+    df_out = convert_batch(args.inputs, mappings, workers=args.workers)
+    df_out.to_excel(args.output, index=False)
+    print(f"{len(df_out)}人 ➡ {args.output}")
+
+
+if __name__ == "__main__":
+    import sys
+    #exe（PyInstaller --onefile）から子プロセスを起動したときは、ここで子プロセスとして動く
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1:
+        main()
+    else:
+        start_gui()
@@ -0,0 +1,120 @@
+import csv
+import math
+import os
+from json.encoder import encode_basestring
+
+from MatchShinkan import log, write_excel
+import profiler
+from timeslot import convert_date
+
+#pyarrow が入っていれば Parquet でも出力できる
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+#結果・未割当・空き講師を1つの表にまとめ、kind（match / unmatched / unused）で区別する
+#未割当の生徒は希望枠ごとに1行（希望枠が残っていなければ日付・時間なしで1行）
+#時間帯として読めなかった希望（生徒・講師とも）も、書かれていた値を time に入れて1行ずつ出す
+COLUMNS = ["kind", "name", "line", "instrument", "date", "time", "teacher", "teacher_instrument", "remarks"]
+
+
+#NaN（空セル）は None、それ以外は文字列にそろえる（列ごとの型を固定するため）
+def text(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return str(value)
+
+#1行ずつ COLUMNS の順のタプルを返す（write_excel と同じく結果は枠の順）
+def iter_records(result, unmatched, unused_teachers):
+    labels = {}#同じ枠の日付・時間の文字列は1回だけ作る
+    def label(slot):
+        if slot not in labels:
+            labels[slot] = (slot.date, slot.time)
+        return labels[slot]
+
+    for slot, matches in sorted(result.items()):
+        date, time = label(slot)
+        for m in matches:
+            s, t = m.student, m.teacher
+            yield ("match", text(s.name), text(s.line), s.instrument, date, time, text(t.name), t.instrument, text(s.remarks))
+    for entries in unmatched.values():
+        for s in entries:
+            head = ("unmatched", text(s.name), text(s.line), s.instrument)
+            if not s.availability and not s.unparsed:
+                yield head + (None, None, None, None, text(s.remarks))
+            for slot in s.availability:
+                yield head + label(slot) + (None, None, text(s.remarks))
+            for date, value in s.unparsed:
+                yield head + (convert_date(date), value, None, None, text(s.remarks))
+    for t in unused_teachers:
+        if t.slot is None:
+            date, value = t.unparsed
+            yield ("unused", text(t.name), None, t.instrument, convert_date(date), value, None, None, None)
+        else:
+            yield ("unused", text(t.name), None, t.instrument) + label(t.slot) + (None, None, None)
+
+
+#CSV（UTF-8、見出し行あり）
+@profiler.timed("write_csv")
+def write_csv(result, unmatched, unused_teachers, path):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(iter_records(result, unmatched, unused_teachers))
+    log(f"CSV出力完了: {path}")
+
+#JSON Lines（1行に1件の JSON オブジェクト）
+#値はすべて文字列か None なので、json.dumps を使わず行の雛形に埋め込む（同じ値の変換は1回だけ）
+@profiler.timed("write_jsonl")
+def write_jsonl(result, unmatched, unused_teachers, path):
+    template = "{" + ",".join(f"{encode_basestring(name)}:%s" for name in COLUMNS) + "}\n"
+    encoded = {None: "null"}
+    def encode(value):
+        encoded[value] = encode_basestring(value)
+        return encoded[value]
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(template % tuple([encoded[v] if v in encoded else encode(v) for v in record])
+                     for record in iter_records(result, unmatched, unused_teachers))
+    log(f"JSON Lines出力完了: {path}")
+
+#Parquet（列ごとにまとめて書く。pyarrow が必要）
+@profiler.timed("write_parquet")
+def write_parquet(result, unmatched, unused_teachers, path):
+    if pa is None:
+        raise ImportError("Parquet で出力するには pyarrow が必要です")
+    records = list(iter_records(result, unmatched, unused_teachers))
+    columns = list(zip(*records)) if records else [()] * len(COLUMNS)
+    table = pa.table({name: pa.array(values, type=pa.string()) for name, values in zip(COLUMNS, columns)})
+    pq.write_table(table, path)
+    log(f"Parquet出力完了: {path}")
+
+
+#形式 ➡ (拡張子, 書き出し関数)
+FORMATS = {
+    "xlsx": (".xlsx", write_excel),
+    "csv": (".csv", write_csv),
+    "jsonl": (".jsonl", write_jsonl),
+    "parquet": (".parquet", write_parquet),
+}
+
+#使える形式（pyarrow がなければ Parquet を除く）
+def available_formats():
+    return [name for name in FORMATS if name != "parquet" or pa is not None]
+
+#拡張子から形式を決める（分からなければ xlsx）
+def format_for(path):
+    ext = os.path.splitext(path)[1].lower()
+    return next((name for name, (suffix, _) in FORMATS.items() if suffix == ext), "xlsx")
+
+#形式を指定して書き出す（省略時は path の拡張子から決める。split_mode は xlsx のときだけ使う）
+def export(result, unmatched, unused_teachers, path, fmt=None, split_mode=1):
+    fmt = fmt or format_for(path)
+    if fmt not in FORMATS:
+        raise ValueError(f"出力形式が不明です: {fmt}")
+    writer = FORMATS[fmt][1]
+    if fmt == "xlsx":
+        writer(result, unmatched, unused_teachers, path, split_mode)
+    else:
+        writer(result, unmatched, unused_teachers, path)
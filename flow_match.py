@@ -0,0 +1,274 @@
+from collections import defaultdict, deque
+
+from MatchShinkan import (log, match, expand_teacher_availability,
+                          build_teacher_index, count_placed, collect_leftovers)
+from records import Match
+import profiler
+from timeslot import split_slot
+
+DRUM = "ドラム"
+
+
+#最大流グラフ（Dinic法）
+class FlowGraph:
+    def __init__(self):
+        self.adj = []
+        self.to = []
+        self.cap = []
+
+    def add_node(self):
+        self.adj.append([])
+        return len(self.adj) - 1
+
+    def add_edge(self, u, v, cap):
+        self.adj[u].append(len(self.to))
+        self.to.append(v)
+        self.cap.append(cap)
+        self.adj[v].append(len(self.to))
+        self.to.append(u)
+        self.cap.append(0)
+        return len(self.to) - 2
+
+    def flow_on(self, edge):
+        return self.cap[edge ^ 1]
+
+    def max_flow(self, s, t):
+        total = 0
+        while True:
+            level = self._levels(s, t)
+            if level[t] < 0:
+                return total
+            it = [0] * len(self.adj)
+            while True:
+                f = self._augment(s, t, level, it)
+                if not f:
+                    break
+                total += f
+
+    def _levels(self, s, t):
+        level = [-1] * len(self.adj)
+        level[s] = 0
+        queue = deque([s])
+        while queue:
+            u = queue.popleft()
+            for e in self.adj[u]:
+                v = self.to[e]
+                if self.cap[e] > 0 and level[v] < 0:
+                    level[v] = level[u] + 1
+                    queue.append(v)
+        return level
+
+    #レベルグラフ上で増加路を1本探して流す（再帰を使わない）
+    def _augment(self, s, t, level, it):
+        adj, to, cap = self.adj, self.to, self.cap
+        stack = [s]
+        path = []
+        while stack:
+            u = stack[-1]
+            if u == t:
+                f = min(cap[e] for e in path)
+                for e in path:
+                    cap[e] -= f
+                    cap[e ^ 1] += f
+                return f
+            edges = adj[u]
+            while it[u] < len(edges):
+                e = edges[it[u]]
+                if cap[e] > 0 and level[to[e]] == level[u] + 1:
+                    break
+                it[u] += 1
+            else:
+                stack.pop()
+                if path:
+                    path.pop()
+                    it[stack[-1]] += 1
+                continue
+            stack.append(to[e])
+            path.append(e)
+        return 0
+
+
+#希望枠の一覧（分割ありなら分割後の枠）
+def student_slots(student, allow_split, split_interval):
+    slots = []
+    for slot in student.availability:
+        slots.extend(split_slot(slot, split_interval) if allow_split else (slot,))
+    return list(dict.fromkeys(slots))
+
+
+#枠の種類（ドラム/それ以外）を固定して1回フローを解く
+#fixed: slot_key ➡ True(ドラム枠) / False(ドラム以外の枠)、未登録の枠はどちらも受け付ける
+#生徒 ➡ (枠, 楽器) ➡ (講師, 枠) ➡ 枠 ➡ シンク の順に流す
+@profiler.timed("solve_flow")
+def solve_flow(entries, teacher_index, fixed, max_per_instrument, max_pair, drum_max_per_slot):
+    g = FlowGraph()
+    source, sink = g.add_node(), g.add_node()
+    drum_cap = min(drum_max_per_slot, max_pair)
+
+    slot_nodes = {}
+    drum_nodes = {}
+    lesson_nodes = {}
+
+    def slot_node(slot_key):
+        if slot_key not in slot_nodes:
+            node = g.add_node()
+            cap = drum_cap if fixed.get(slot_key) is True else max_pair
+            g.add_edge(node, sink, cap)
+            slot_nodes[slot_key] = node
+        return slot_nodes[slot_key]
+
+    #固定されていない枠では、ドラムの組数だけを別に制限する
+    def drum_node(slot_key):
+        if slot_key not in drum_nodes:
+            node = g.add_node()
+            g.add_edge(node, slot_node(slot_key), drum_cap)
+            drum_nodes[slot_key] = node
+        return drum_nodes[slot_key]
+
+    #講師1人・1コマ = 容量1（同じ講師が別の楽器でも同じ枠に入らないよう名前でまとめる）
+    position_nodes = {}
+    def position_node(teacher_name, slot_key, is_drum):
+        pkey = (teacher_name, slot_key, is_drum)
+        if pkey not in position_nodes:
+            node = g.add_node()
+            if is_drum and slot_key not in fixed:
+                g.add_edge(node, drum_node(slot_key), 1)
+            else:
+                g.add_edge(node, slot_node(slot_key), 1)
+            position_nodes[pkey] = node
+        return position_nodes[pkey]
+
+    teacher_edges = []  #(edge, lesson_key, 講師)
+    def lesson_node(instrument, slot_key, is_drum):
+        lkey = (instrument, slot_key)
+        if lkey not in lesson_nodes:
+            node = g.add_node()
+            seen = set()
+            for teacher in teacher_index[(instrument, slot_key)]:
+                if teacher.name in seen:
+                    continue
+                seen.add(teacher.name)
+                edge = g.add_edge(node, position_node(teacher.name, slot_key, is_drum), 1)
+                teacher_edges.append((edge, lkey, teacher))
+            lesson_nodes[lkey] = node
+        return lesson_nodes[lkey]
+
+    source_edges = []
+    student_edges = []  #(edge, lesson_key, 生徒)
+    for (name, instrument), options in entries.items():
+        is_drum = instrument == DRUM
+        entry = g.add_node()
+        source_edges.append(g.add_edge(source, entry, 1))
+        for slot_key, student in options:
+            if fixed.get(slot_key, is_drum) != is_drum:
+                continue
+            if (instrument, slot_key) not in teacher_index:
+                continue
+            #容量1なので同じ枠に同じ楽器で2コマは入らない
+            edge = g.add_edge(entry, lesson_node(instrument, slot_key, is_drum), 1)
+            student_edges.append((edge, (instrument, slot_key), student))
+
+    #まず全員1コマずつ、その後に2コマ目以降を増やす（1コマ目は減らない）
+    g.max_flow(source, sink)
+    if max_per_instrument > 1:
+        for e in source_edges:
+            g.cap[e] += max_per_instrument - 1
+        g.max_flow(source, sink)
+
+    #(枠, 楽器) に流れ込んだ生徒と流れ出た講師を組にする
+    teachers_by_lesson = defaultdict(list)
+    for edge, lkey, teacher in teacher_edges:
+        if g.flow_on(edge):
+            teachers_by_lesson[lkey].append(teacher)
+    assignments = []
+    for edge, lkey, student in student_edges:
+        if g.flow_on(edge):
+            assignments.append((student, teachers_by_lesson[lkey].pop(), lkey[1]))
+    return assignments
+
+
+#ドラムとそれ以外が同じ枠に混ざったら、多い方に固定して解き直す
+def solve_with_fixing(entries, teacher_index, fixed, max_per_instrument, max_pair, drum_max_per_slot):
+    fixed = dict(fixed)
+    while True:
+        assignments = solve_flow(entries, teacher_index, fixed, max_per_instrument, max_pair, drum_max_per_slot)
+        drums = defaultdict(int)
+        others = defaultdict(int)
+        for student, teacher, slot_key in assignments:
+            if teacher.instrument == DRUM:
+                drums[slot_key] += 1
+            else:
+                others[slot_key] += 1
+        mixed = [k for k in drums if k in others]
+        if not mixed:
+            return assignments
+        for slot_key in mixed:
+            fixed[slot_key] = drums[slot_key] > others[slot_key]
+
+
+def score(assignments):
+    return len({(s.name, s.instrument) for s, _, _ in assignments}), len(assignments)
+
+
+#最大流によるマッチング（match() と同じ (result, unmatched, unused_teachers) を返す）
+#drum_exclusive の有無にかかわらず match() はドラムと他楽器を同じ枠に入れないので、ここでも同じ扱いにする
+def match_flow(teachers, students, max_per_instrument=1, drum_exclusive=True,
+               allow_split=False, split_interval=30, max_pair=2,
+               drum_max_per_slot=1, stats=None):
+
+    #比較用に貪欲法を実行
+    greedy_stats = {}
+    greedy_result, _, _ = match(teachers, students,
+                                max_per_instrument=max_per_instrument, drum_exclusive=drum_exclusive,
+                                allow_split=allow_split, split_interval=split_interval,
+                                max_pair=max_pair, drum_max_per_slot=drum_max_per_slot,
+                                stats=greedy_stats)
+
+    students = sorted(students, key=lambda s: len(s.availability))
+    if allow_split:
+        teachers = expand_teacher_availability(teachers, split_interval)
+    teacher_index = build_teacher_index(teachers)
+
+    #(名前, 楽器) ごとの希望枠（同じ枠は最初に出てきた行を使う）
+    entries = defaultdict(dict)
+    for student in students:
+        options = entries[(student.name, student.instrument)]
+        for slot_key in student_slots(student, allow_split, split_interval):
+            options.setdefault(slot_key, student)
+    entries = {key: list(options.items()) for key, options in entries.items()}
+
+    #貪欲法の枠の種類から始めた解と、何も固定しない解の良い方を使う
+    greedy_fixed = {}
+    for slot_key, matches in greedy_result.items():
+        if matches:
+            greedy_fixed[slot_key] = any(m.teacher.instrument == DRUM for m in matches)
+    best = None
+    for fixed in (greedy_fixed, {}):
+        assignments = solve_with_fixing(entries, teacher_index, fixed, max_per_instrument, max_pair, drum_max_per_slot)
+        if best is None or score(assignments) > score(best):
+            best = assignments
+
+    #match() と同じ形に組み立てる
+    order = {id(s): i for i, s in enumerate(students)}
+    best.sort(key=lambda a: order[id(a[0])])
+    result = defaultdict(list)
+    teacher_usage = defaultdict(set)
+    student_instr_count = defaultdict(int)
+    student_used_slots = defaultdict(set)
+    for student, teacher, slot_key in best:
+        result[slot_key].append(Match(student, teacher))
+        teacher_usage[(teacher.name, slot_key)] = True
+        student_instr_count[(student.name, student.instrument)] += 1
+        student_used_slots[student.name].add(slot_key)
+
+    placed = count_placed(result)
+    gain = placed - greedy_stats["placed"]
+    log(f"[match_flow] 割り当て {placed}件（貪欲法 {greedy_stats['placed']}件, 差 {gain:+d}件）")
+    if stats is not None:
+        stats["placed"] = placed
+        stats["greedy_placed"] = greedy_stats["placed"]
+        stats["gain"] = gain
+
+    unmatched, unused_teachers = collect_leftovers(teachers, students, teacher_usage,
+                                                   student_instr_count, student_used_slots)
+    return result, unmatched, unused_teachers
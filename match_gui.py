@@ -0,0 +1,270 @@
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk, IntVar, BooleanVar, StringVar
+import datetime
+import queue
+import threading
+
+from MatchShinkan import log, read_people, match
+from cache import cached_match
+from export import FORMATS, available_formats, export
+
+#中止ボタンで投げる例外（進捗の通知の中で投げて処理を抜ける）
+class Cancelled(Exception):
+    pass
+
+
+#進捗バーの段階ごとの範囲（%）
+STAGE_RANGES = {
+    "teachers": (0, 10),
+    "students": (10, 30),
+    "match": (30, 100),
+}
+
+#ファイル形式の表示名
+FORMAT_LABELS = {
+    "xlsx": "Excel",
+    "csv": "CSV",
+    "jsonl": "JSON Lines",
+    "parquet": "Parquet",
+}
+
+
+#tkGUI処理
+class MatchApp:
+    def __init__(self, root):
+        self.root = root
+        self.teacher_file = None
+        self.student_file = None
+        self.max_teacher_slot = IntVar(value=1)
+        self.max_pair = IntVar(value=2)
+        self.drum_exclusive = BooleanVar(value=False)
+        self.output_excel = BooleanVar(value=True)
+        self.output_pdf = BooleanVar(value=True)
+        self.output_format = StringVar(value="xlsx")
+        self.max_slots_per_instrument = IntVar(value=1)
+        self.enable_split = BooleanVar(value=False)
+        self.split_minutes = IntVar(value=30)
+        self.output_mode = IntVar(value=1)
+        self.prefer_same_teacher = BooleanVar(value=False)
+        self.drum_max_per_slot = IntVar(value=1)
+        self.prefer_continuous = BooleanVar(value=False)
+        self.use_flow = BooleanVar(value=False)
+        self.order_by_options = BooleanVar(value=False)
+        self.improve_seconds = IntVar(value=0)
+        self.use_cache = BooleanVar(value=True)
+        self.events = queue.Queue()#ワーカースレッド ➡ 画面 への通知
+        self.cancel_event = None
+        self.rounds = 1
+
+        root.title("講習マッチング")
+        root.geometry("520x860")
+
+        tk.Button(root, text="講師ファイルを選択", command=self.load_teacher).pack(pady=5)
+        tk.Button(root, text="生徒ファイルを選択", command=self.load_student).pack(pady=5)
+
+        tk.Label(root, text="① 講師1人につき1コマの生徒人数").pack()
+        tk.Spinbox(root, from_=1, to=5, textvariable=self.max_teacher_slot, width=5).pack()
+
+        tk.Label(root, text="② 同時間帯に最大組数").pack()
+        tk.Spinbox(root, from_=1, to=5, textvariable=self.max_pair, width=5).pack()
+
+        tk.Checkbutton(root, text="③ ドラムは他楽器と同時不可", variable=self.drum_exclusive).pack()
+
+        tk.Label(root, text="④ ドラムの1コマ最大組数").pack()
+        tk.Spinbox(root, from_=1, to=5, textvariable=self.drum_max_per_slot, width=5).pack()
+
+        tk.Label(root, text="⑤ 楽器ごとに最大何枠まで許可").pack()
+        tk.Spinbox(root, from_=1, to=10, textvariable=self.max_slots_per_instrument, width=5).pack()
+
+        tk.Checkbutton(root, text="⑥ 割り当て失敗時、時間枠を分割して再試行", variable=self.enable_split).pack()
+        tk.Label(root, text="分割単位（分）").pack()
+        tk.Radiobutton(root, text="30分ごと", variable=self.split_minutes, value=30).pack()
+        tk.Radiobutton(root, text="20分ごと", variable=self.split_minutes, value=20).pack()
+
+        tk.Checkbutton(root, text="⑦ 2枠目もできるだけ同じ講師にする", variable=self.prefer_same_teacher).pack()
+        tk.Checkbutton(root, text="⑧ 講習会のコマをできるだけ連続にする", variable=self.prefer_continuous).pack()
+        tk.Checkbutton(root, text="⑨ 最適化（最大流）で割り当てる", variable=self.use_flow).pack()
+        tk.Checkbutton(root, text="⑩ 入れる講師・枠の少ない生徒から割り当てる", variable=self.order_by_options).pack()
+        tk.Label(root, text="⑪ 割り当て後に入れ替えで改善する時間（秒、0で無効）").pack()
+        tk.Spinbox(root, from_=0, to=60, textvariable=self.improve_seconds, width=5).pack()
+        tk.Checkbutton(root, text="前回と同じファイル・設定なら保存済みの結果を使う", variable=self.use_cache).pack()
+
+        tk.Label(root, text="<出力形式>").pack()
+        tk.Radiobutton(root, text="1シートにまとめる", variable=self.output_mode, value=1).pack()
+        tk.Radiobutton(root, text="日付ごとに分ける", variable=self.output_mode, value=2).pack()
+        tk.Radiobutton(root, text="両方出力", variable=self.output_mode, value=3).pack()
+
+        tk.Checkbutton(root, text="ファイルに出力", variable=self.output_excel).pack()
+        #CSV・JSON Lines・Parquet は結果の表だけを出力する（上の出力形式は Excel のときだけ使う）
+        formats = tk.Frame(root)
+        formats.pack()
+        for fmt in available_formats():
+            tk.Radiobutton(formats, text=FORMAT_LABELS[fmt], variable=self.output_format, value=fmt).pack(side=tk.LEFT)
+
+        self.start_button = tk.Button(root, text="マッチング開始", command=self.run, bg="lightgreen")
+        self.start_button.pack(pady=(20, 5))
+        self.progress = ttk.Progressbar(root, length=360, maximum=100)
+        self.progress.pack()
+        self.status = tk.Label(root, text="")
+        self.status.pack()
+        self.cancel_button = tk.Button(root, text="中止", command=self.cancel, state=tk.DISABLED)
+        self.cancel_button.pack(pady=5)
+        root.after(100, self.poll)
+
+    def load_teacher(self):
+        path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx")])
+        if path:
+            self.teacher_file = path
+            messagebox.showinfo("読み込み成功", "講師ファイルを読み込みました")
+            log(f"講師ファイル読み込み: {path}")
+
+    def load_student(self):
+        path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx")])
+        if path:
+            self.student_file = path
+            messagebox.showinfo("読み込み成功", "生徒ファイルを読み込みました")
+            log(f"生徒ファイル読み込み: {path}")
+
+    def run(self):
+        if not self.teacher_file or not self.student_file:
+            messagebox.showwarning("エラー", "両ファイルを選択してください")
+            return
+        #Tk の変数は画面のスレッドで読んでおく
+        options = dict(
+            max_per_instrument=self.max_slots_per_instrument.get(),
+            drum_exclusive=self.drum_exclusive.get(),
+            allow_split=self.enable_split.get(),
+            split_interval=self.split_minutes.get(),
+            max_pair=self.max_pair.get(),
+            drum_max_per_slot=self.drum_max_per_slot.get(),
+            prefer_same_teacher=self.prefer_same_teacher.get(),
+            prefer_continuous=self.prefer_continuous.get(),
+            engine="flow" if self.use_flow.get() else "greedy",
+            order="options" if self.order_by_options.get() else "availability",
+            improve_seconds=self.improve_seconds.get(),
+        )
+        self.rounds = 2 if options["max_per_instrument"] > 1 else 1
+        self.cancel_event = threading.Event()
+        self.start_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.progress["value"] = 0
+        threading.Thread(target=self.match_worker,
+                         args=(self.teacher_file, self.student_file, options, self.cancel_event,
+                               self.use_cache.get()),
+                         daemon=True).start()
+
+    def cancel(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.status.config(text="中止しています…")
+
+    #ワーカースレッド：読み込み ➡ マッチング（画面には触らず events に通知する）
+    def match_worker(self, teacher_file, student_file, options, cancel_event, use_cache=True):
+        def reporter(stage):
+            def progress(step, done, total):
+                if cancel_event.is_set():
+                    raise Cancelled()
+                self.events.put(("progress", stage, step, done, total))
+            return progress
+        try:
+            #同じファイル・同じ設定なら前回の結果をキャッシュから使う
+            if use_cache:
+                *result, stats = cached_match(teacher_file, student_file, progress=reporter("match"),
+                                              teacher_progress=reporter("teachers"),
+                                              student_progress=reporter("students"), **options)
+            else:
+                teachers = read_people(teacher_file, progress=reporter("teachers"))
+                students = read_people(student_file, progress=reporter("students"))
+                stats = {}
+                result = match(teachers, students, stats=stats, progress=reporter("match"), **options)
+            #flow・キャッシュから読んだときは途中で progress が来ないので、終わったあとにも確かめる
+            if cancel_event.is_set():
+                raise Cancelled()
+            self.events.put(("matched", tuple(result), stats))
+        except Cancelled:
+            log("マッチングを中止しました")
+            self.events.put(("cancelled",))
+        except Exception as e:
+            log(f"エラー: {str(e)}")
+            self.events.put(("match_error", str(e)))
+
+    #書き出しは別スレッドで行い、その間に次のマッチングを始められるようにする
+    def export_worker(self, result, path, fmt, output_mode):
+        try:
+            export(*result, path, fmt, output_mode)
+            self.events.put(("exported", path))
+        except Exception as e:
+            log(f"エラー: {str(e)}")
+            self.events.put(("export_error", str(e)))
+
+    #ワーカーからの通知を画面に反映する（100ms ごと）
+    def poll(self):
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            kind = event[0]
+            if kind == "progress":
+                self.show_progress(*event[1:])
+            elif kind == "matched":
+                self.finish_matching()
+                self.on_matched(*event[1:])
+            elif kind == "cancelled":
+                self.finish_matching()
+                self.status.config(text="中止しました")
+            elif kind == "match_error":
+                self.finish_matching()
+                self.status.config(text="エラー")
+                messagebox.showerror("エラー", event[1])
+            elif kind == "exported":
+                messagebox.showinfo("出力完了", f"ファイルを出力しました\n{event[1]}")
+            elif kind == "export_error":
+                messagebox.showerror("エラー", event[1])
+        self.root.after(100, self.poll)
+
+    def show_progress(self, stage, step, done, total):
+        #改善は時間で区切るので、バーは動かさず経過時間だけ出す
+        if step == "improve":
+            self.status.config(text=f"改善中: {done / 1000:.1f} / {total / 1000:.0f}秒")
+            return
+        low, high = STAGE_RANGES[stage]
+        fraction = done / total if total else 0
+        #楽器ごとに2枠以上なら assign_slots は2周するので、範囲を半分ずつ使う
+        if step.startswith("assign_slots(") and self.rounds > 1:
+            fraction = (fraction + (step != "assign_slots(1)")) / 2
+        self.progress["value"] = low + (high - low) * fraction
+        self.status.config(text=f"{step}: {done}" + (f" / {total}" if total else ""))
+
+    def finish_matching(self):
+        self.cancel_event = None
+        self.start_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+
+    def on_matched(self, result, stats):
+        self.progress["value"] = 100
+        self.status.config(text=f"割り当て {stats['placed']}件"
+                                + (f"（改善 {stats['improve_gain']:+d}件）" if "improve_gain" in stats else ""))
+        if "gain" in stats:
+            messagebox.showinfo("最適化結果", f"割り当て {stats['placed']}件（貪欲法より {stats['gain']:+d}件）")
+
+        now = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        if self.output_excel.get():
+            fmt = self.output_format.get()
+            suffix = FORMATS[fmt][0]
+            path = filedialog.asksaveasfilename(defaultextension=suffix, initialfile=f"講習会マッチング表_{now}{suffix}",
+                                                filetypes=[(f"{FORMAT_LABELS[fmt]} files", f"*{suffix}")])
+            if path:
+                self.status.config(text=f"割り当て {stats['placed']}件 / 書き出し中…")
+                #書き出し中に窓を閉じてもファイルが途中で切れないよう daemon にしない
+                threading.Thread(target=self.export_worker, args=(result, path, fmt, self.output_mode.get())).start()
+
+#アプリ起動
+def run_gui():
+    root = tk.Tk()
+    app = MatchApp(root)
+    root.mainloop()
+
+if __name__ == "__main__":
+    run_gui()
@@ -0,0 +1,177 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from MatchShinkan import (log, logger, setup_worker_logging, MatchState, TeacherRoster, count_placed,
+                          record_improvement)
+import profiler
+from timeslot import Slot
+
+#ワーカーごとに1回だけ受け取るデータ（講師は分割済み）
+worker_teachers = None
+worker_students = None
+worker_options = None
+worker_profile = False#親で計測中なら、ジョブごとに計測して段階・カウンタを返す
+
+
+def init_worker(teachers, students, options, log_level, profile=False):
+    global worker_teachers, worker_students, worker_options, worker_profile
+    worker_teachers = teachers
+    worker_students = students
+    worker_options = options
+    worker_profile = profile
+    setup_worker_logging(log_level)
+
+
+#番号で受け取った生徒・講師だけで貪欲法を解き、割り当てを番号で返す
+#計測中なら (割り当て, (段階, カウンタ))、そうでなければ (割り当て, None) を返す
+#生徒は main で並べ替え・絞り込み済みの順に渡すので、そのまま run に渡す
+#（講師は分割済みなので分割し直さない。allow_split は生徒の希望枠を分割するのに使う）
+def solve_job(job):
+    student_ids, teacher_ids = job
+    students = [worker_students[i] for i in student_ids]
+    teachers = [worker_teachers[i] for i in teacher_ids]
+    if worker_options["allow_split"]:
+        teachers = TeacherRoster(teachers, worker_options["split_interval"])
+    if worker_profile:
+        profiler.start()
+    state = MatchState(teachers, students, **worker_options)
+    state.run(students)
+    student_pos = {id(s): i for s, i in zip(students, student_ids)}
+    teacher_pos = {id(t): i for t, i in zip(state.teachers, teacher_ids)}
+    output = [(slot_key, [(student_pos[id(m.student)], teacher_pos[id(m.teacher)]) for m in matches])
+              for slot_key, matches in state.result.items()]
+    if not worker_profile:
+        return output, None
+    job_profile = profiler.stop()
+    return output, (job_profile.stages, dict(job_profile.counters))
+
+
+#互いに影響しない生徒のまとまりに分ける（Union-Find）
+#同じ枠を使える生徒・同じ (名前, 楽器) の生徒はつながる。prefer_continuous のときは同じ名前もつなげる
+#返り値: まとまりの代表 ➡ 生徒の番号のリスト（元の順番のまま）と、枠 ➡ まとまりの代表
+def find_components(state, students):
+    parent = {}
+    def find(x):
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    teacher_index = state.teacher_index
+    roots = []
+    for student in students:
+        entry = ("entry", student.name, student.instrument)
+        root = find(parent.setdefault(entry, entry))
+        if state.prefer_continuous:
+            name = ("name", student.name)
+            other = find(parent.setdefault(name, name))
+            if other != root:
+                parent[other] = root
+        instrument = student.instrument
+        for slot in student.availability:
+            for slot_key in state.candidate_slots(slot):
+                if (instrument, slot_key) not in teacher_index:
+                    continue
+                other = find(parent.setdefault(slot_key, slot_key))
+                if other != root:
+                    parent[other] = root
+        roots.append(entry)
+
+    components = defaultdict(list)
+    for i, entry in enumerate(roots):
+        components[find(entry)].append(i)
+    slot_roots = {key: find(key) for key in parent if isinstance(key, Slot)}
+    return components, slot_roots
+
+
+#まとまりを大きい順に、生徒数がなるべく均等になるよう jobs 個に詰める（まとまりの代表 ➡ ジョブ番号）
+def pack_components(components, jobs):
+    sizes = [0] * max(1, min(jobs, len(components)))
+    assignment = {}
+    for root, members in sorted(components.items(), key=lambda item: len(item[1]), reverse=True):
+        i = sizes.index(min(sizes))
+        assignment[root] = i
+        sizes[i] += len(members)
+    return assignment, len(sizes)
+
+
+#日付・楽器ごとに独立したまとまりに分けて、プロセスプールで並列に貪欲法を解く
+#まとまり同士は枠・講師・生徒のどの状態も共有しないので、結果は match(engine="greedy") と同じになる
+#1プロセスのとき・まとまりが1つのときは分けずにそのまま解く
+#improve_seconds があれば、まとめた状態で improve() する
+def match_parallel(teachers, students, workers=None, stats=None, progress=None, improve_seconds=0, **options):
+    state = MatchState(teachers, students, **options)
+    feasible = state.feasible_students()
+    workers = workers or os.cpu_count() or 1
+
+    components, tasks = {}, []
+    if workers > 1:
+        with profiler.stage("find_components"):
+            components, slot_roots = find_components(state, feasible)
+    if len(components) > 1:
+        tasks = make_tasks(state, feasible, components, slot_roots, workers)
+        solve_tasks(state, tasks, workers, options, progress)
+    else:
+        state.progress = progress
+        state.run(feasible)
+
+    improvement = None
+    if improve_seconds > 0:
+        state.progress = progress
+        improvement = state.improve(improve_seconds)
+
+    placed = count_placed(state.result)
+    jobs = len(tasks) or 1
+    log(f"[match_parallel] まとまり {len(components)}個 ➡ ジョブ {jobs}個, 割り当て {placed}件")
+    if stats is not None:
+        stats["placed"] = placed
+        record_improvement(stats, improvement)
+        stats["components"] = len(components)
+        stats["jobs"] = jobs
+
+    unmatched, unused_teachers = state.leftovers()
+    return state.result, unmatched, unused_teachers
+
+
+#まとまりを workers * 4 個程度のジョブに詰め、ジョブごとの（生徒の番号, 講師の番号）を返す
+def make_tasks(state, feasible, components, slot_roots, workers):
+    job_of, job_count = pack_components(components, workers * 4)
+
+    #ジョブごとの生徒（元の順番）と講師（ジョブの枠に入れる講師だけ）
+    student_pos = {id(s): i for i, s in enumerate(state.students)}
+    teacher_pos = {id(t): i for i, t in enumerate(state.teachers)}
+    job_students = [[] for _ in range(job_count)]
+    for root, members in components.items():
+        job_students[job_of[root]].extend(members)
+    job_teachers = [set() for _ in range(job_count)]
+    for (instrument, slot_key), candidates in state.teacher_index.items():
+        root = slot_roots.get(slot_key)
+        if root is not None:
+            job_teachers[job_of[root]].update(teacher_pos[id(t)] for t in candidates)
+    return [([student_pos[id(feasible[i])] for i in sorted(members)], sorted(teachers))
+            for members, teachers in zip(job_students, job_teachers) if members]
+
+
+#ジョブをプロセスプールで解き、割り当てを元の生徒・講師に戻して state にまとめる
+def solve_tasks(state, tasks, workers, options, progress=None):
+    options = dict(options, allow_split=state.allow_split, split_interval=state.split_interval)
+    outputs = []
+    with profiler.stage("solve_jobs"):
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(state.teachers, state.students, options, logger.level or None,
+                                           profiler.current is not None)) as pool:
+            for done, (output, job_profile) in enumerate(pool.map(solve_job, tasks), start=1):
+                outputs.append(output)
+                if job_profile is not None:
+                    profiler.merge(*job_profile)
+                if progress is not None:
+                    progress("match_parallel", done, len(tasks))
+
+    for output in outputs:
+        for slot_key, pairs in output:
+            state.result[slot_key]
+            for s, t in pairs:
+                state.assign(state.students[s], state.teachers[t], slot_key)
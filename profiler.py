@@ -0,0 +1,94 @@
+import contextlib
+import functools
+import json
+import time
+from collections import defaultdict
+
+#処理段階ごとの時間（実時間・CPU時間）と、割り当て処理のカウンタを集める
+#profiler.start() してから処理を実行し、profiler.stop() で結果を受け取る（start しなければ何もしない）
+class Profiler:
+    def __init__(self):
+        self.stages = {}
+        self.counters = defaultdict(int)
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
+
+    #同じ名前の段階は回数・時間を合算する
+    @contextlib.contextmanager
+    def stage(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0})
+            entry["calls"] += 1
+            entry["wall"] += time.perf_counter() - wall
+            entry["cpu"] += time.process_time() - cpu
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    #別プロセスで計測した段階・カウンタを足し込む（段階の時間はプロセスごとの合計なので、全体の実時間を超えることがある）
+    def merge(self, stages, counters):
+        for name, e in stages.items():
+            entry = self.stages.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0})
+            for key in entry:
+                entry[key] += e[key]
+        for name, n in counters.items():
+            self.counters[name] += n
+
+    def report(self):
+        return {
+            "total": {"wall": round(time.perf_counter() - self.started, 6),
+                      "cpu": round(time.process_time() - self.started_cpu, 6)},
+            "stages": {name: {"calls": e["calls"], "wall": round(e["wall"], 6), "cpu": round(e["cpu"], 6)}
+                       for name, e in self.stages.items()},
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+
+current = None
+
+
+def start():
+    global current
+    current = Profiler()
+    return current
+
+def stop():
+    global current
+    profiler, current = current, None
+    return profiler
+
+
+#計測中でなければ何もしない
+def stage(name):
+    return current.stage(name) if current is not None else contextlib.nullcontext()
+
+def count(name, n=1):
+    if current is not None:
+        current.count(name, n)
+
+def merge(stages, counters):
+    if current is not None:
+        current.merge(stages, counters)
+
+#割り当てのループで使うカウンタ（計測中でなければ None）
+def counters():
+    return current.counters if current is not None else None
+
+#関数全体を1つの段階として計測するデコレータ
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if current is None:
+                return func(*args, **kwargs)
+            with current.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,112 @@
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+#python-calamine が入っていれば pandas の calamine エンジンで読む（速い）
+#必須ではない（pip install python-calamine で入れる。なければ openpyxl の read_only で読む）
+try:
+    import python_calamine  # noqa: F401
+    FAST_ENGINE = "calamine"
+except ImportError:
+    FAST_ENGINE = None
+
+
+#シート名の一覧（read_only で開くのでシートの中身は読まない）
+def list_sheets(path):
+    wb = load_workbook(path, read_only=True)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+#openpyxl の値を read_excel と同じ形にそろえる（13.0 ➡ 13）
+def clean_value(v):
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+
+
+#シートを1行ずつ返す（read_only・値のみ）
+#read_excel と同じく、行末の空セルと末尾の空行は落とし、途中の空行は残す
+def iter_rows(path, sheet=0):
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[sheet] if isinstance(sheet, int) else wb[sheet]
+        blank = 0
+        for row in ws.iter_rows(values_only=True):
+            end = len(row)
+            while end and row[end - 1] is None:
+                end -= 1
+            if not end:
+                blank += 1
+                continue
+            for _ in range(blank):
+                yield ()
+            blank = 0
+            yield tuple(clean_value(v) for v in row[:end])
+    finally:
+        wb.close()
+
+
+#見出し行 ➡ 列名（空欄は "Unnamed: n"、重複は ".1" ".2" を付ける read_excel と同じ規則）
+def column_names(header):
+    names = []
+    seen = {}
+    for i, v in enumerate(header):
+        name = f"Unnamed: {i}" if v is None else v
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def rows_to_frame(rows, columns=None, width=None):
+    width = width or max((len(r) for r in rows), default=0)
+    rows = [r + (None,) * (width - len(r)) for r in rows]
+    #型はチャンクごとに推定せず object のまま（区切り方で 5 が 5.0 になったりしないように）
+    frame = pd.DataFrame(rows, columns=columns if columns is not None else range(width), dtype=object)
+    #空欄は read_excel と同じく NaN にする
+    return frame.where(frame.notna(), np.nan)
+
+
+#シートを chunksize 行ずつの DataFrame で返す
+#header=0 なら1行目を列名に、None なら列番号のまま（1行目もデータとして返す）
+def iter_frames(path, sheet=0, header=0, chunksize=5000):
+    rows = iter_rows(path, sheet)
+    columns = None
+    if header == 0:
+        first = next(rows, None)
+        if first is None:
+            return
+        columns = column_names(first)
+    while True:
+        chunk = list(islice(rows, chunksize))
+        if not chunk:
+            return
+        if columns is not None:
+            #見出しより長い行があれば列を足す
+            width = max(len(columns), max(len(r) for r in chunk))
+            columns += [f"Unnamed: {i}" for i in range(len(columns), width)]
+            yield rows_to_frame(chunk, columns, width)
+        else:
+            yield rows_to_frame(chunk)
+
+
+#シート全体を DataFrame で読む（calamine があればそちら、なければ read_only で1行ずつ）
+def read_sheet(path, sheet=0, header=0):
+    if FAST_ENGINE:
+        return pd.read_excel(path, sheet_name=sheet, header=header, engine=FAST_ENGINE)
+    frames = list(iter_frames(path, sheet, header, chunksize=50000))
+    if not frames:
+        return pd.DataFrame()
+    width = max(f.shape[1] for f in frames)
+    if header is None:
+        frames = [f.reindex(columns=range(width)) for f in frames]
+    frame = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    return frame.infer_objects()#型はシート全体で決める（read_excel と同じ）
@@ -0,0 +1,32 @@
+import sys
+from typing import NamedTuple
+
+from timeslot import Slot
+
+
+#講師・生徒1人分（楽器ごとに1件）。同じ行の楽器違いは availability のタプルを共有する
+#unparsed: 時間帯として読めなかった希望（(日付列, 書かれていた値) のタプル。出力の未割当に載せる）
+class Person(NamedTuple):
+    name: object
+    line: object
+    instrument: str
+    remarks: object
+    availability: tuple
+    unparsed: tuple = ()
+
+#1コマの割り当て（生徒と講師）
+class Match(NamedTuple):
+    student: Person
+    teacher: Person
+
+#空いている講師の枠（時間帯として読めなかった希望は slot=None で、unparsed に (日付列, 書かれていた値)）
+class OpenSlot(NamedTuple):
+    name: object
+    instrument: str
+    slot: Slot
+    unparsed: tuple = None
+
+
+#同じ文字列は1つのオブジェクトにまとめる（名前・LINE名など何度も出てくる値）
+def intern_text(value):
+    return sys.intern(value) if isinstance(value, str) else value
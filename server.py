@@ -0,0 +1,174 @@
+import argparse
+import inspect
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from MatchShinkan import (log, setup_logging, read_people, match, clean_instrument_field,
+                          INSTRUMENT_NAMES, TeacherRoster)
+from export import COLUMNS, iter_records
+from records import Person, intern_text
+from timeslot import intern_slot, parse_date, parse_time_range
+
+SPLIT_INTERVALS = (30, 20)#起動時に分割・索引を作っておく分割単位（GUI の選択肢と同じ）
+MAX_BODY = 16 * 1024 * 1024#これより大きい依頼は受け付けない
+
+#依頼で指定できる match() の設定（stats / progress はサーバー側で使う）
+OPTIONS = [name for name, p in inspect.signature(match).parameters.items()
+           if p.default is not inspect.Parameter.empty and name not in ("stats", "progress")]
+
+
+#JSON の生徒1人分 ➡ Person（楽器ごとに1件、シートの1行と同じ扱い）
+#{"name": "...", "line": "...", "instrument": "ギター,ベース" または ["ギター"], "remarks": "...",
+# "availability": {"6/1": "13:00-14:00,15:00-16:00" または ["13:00-14:00"], ...}}
+def parse_student(row):
+    if not isinstance(row, dict):
+        raise ValueError("生徒は JSON オブジェクトで指定してください")
+    if not isinstance(row.get("name"), str) or not row["name"].strip():
+        raise ValueError(f"生徒の名前がありません: {row}")
+    instruments = row.get("instrument")
+    if isinstance(instruments, list):
+        instruments = ",".join(str(i) for i in instruments)
+    availability = row.get("availability") or {}
+    if not isinstance(availability, dict):
+        raise ValueError(f'"availability" は日付 ➡ 時間帯の JSON オブジェクトで指定してください: {row["name"]}')
+    slots = []
+    unparsed = []
+    for date_text, times in availability.items():
+        day = parse_date(date_text)
+        if day is None:
+            log(f"[server] 日付として読めない値: {date_text}", logging.WARNING)
+        if times is not None and not isinstance(times, (str, list)):
+            raise ValueError(f"時間帯は文字列かリストで指定してください: {row['name']} {date_text}")
+        tokens = times if isinstance(times, list) else str(times or "").split(",")
+        for token in tokens:
+            token = str(token).strip()
+            if not token:
+                continue
+            minutes = parse_time_range(token)
+            if minutes is None:
+                log(f"[server] 時間帯として読めない値: {token}", logging.WARNING)
+            if day is None or minutes is None:
+                unparsed.append((date_text, token))#シートと同じく、読めなかった希望は未割当に載せる
+                continue
+            slots.append(intern_slot(day, *minutes))
+    return [Person(intern_text(row.get("name")), intern_text(row.get("line")), INSTRUMENT_NAMES[inst],
+                   row.get("remarks"), tuple(slots), tuple(unparsed))
+            for inst in clean_instrument_field(instruments)]
+
+
+#生徒のまとまり1つを、常駐している講師に割り当てる（依頼ごとに独立で、前の依頼の割り当ては残らない）
+#空き講師（kind="unused"）は生徒の希望がある日付の分だけ返す（"unused": false なら返さない）
+#返り値: {"stats": {...}, "records": [export.COLUMNS の各列を持つ dict, ...]}
+def match_batch(roster, body):
+    if not isinstance(body, dict) or not isinstance(body.get("students"), list):
+        raise ValueError('"students" に生徒のリストを指定してください')
+    options = body.get("options") or {}
+    if not isinstance(options, dict):
+        raise ValueError('"options" は JSON オブジェクトで指定してください')
+    unknown = sorted(set(options) - set(OPTIONS))
+    if unknown:
+        raise ValueError(f"不明な設定: {unknown}")
+    students = [person for row in body["students"] for person in parse_student(row)]
+    stats = {}
+    result, unmatched, unused_teachers = match(roster, students, stats=stats, **options)
+    if body.get("unused", True):
+        days = {slot.day for student in students for slot in student.availability}
+        unused_teachers = [t for t in unused_teachers
+                           if (t.slot.day if t.slot is not None else parse_date(t.unparsed[0])) in days]
+    else:
+        unused_teachers = []
+    records = [dict(zip(COLUMNS, record)) for record in iter_records(result, unmatched, unused_teachers)]
+    return {"stats": stats, "records": records}
+
+
+#講師の名簿を読み込んで分割・索引を作っておき、生徒のまとまりを受け付けて割り当てる
+class MatchServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, teacher_file, sheet=0):
+        self.teacher_file = teacher_file
+        self.sheet = sheet
+        self.roster = None
+        self.reload()
+        super().__init__(address, MatchHandler)
+
+    #名簿を読み直す（処理中の依頼は読み直す前の名簿のまま最後まで使う）
+    def reload(self):
+        roster = TeacherRoster(read_people(self.teacher_file, self.sheet))
+        roster.prepare(False, SPLIT_INTERVALS[0])
+        for interval in SPLIT_INTERVALS:
+            roster.prepare(True, interval)
+        self.roster = roster
+        log(f"[server] 講師名簿を読み込みました: {self.teacher_file}（{len(roster.teachers)}件）")
+        return roster
+
+
+#GET /health: 読み込み済みの名簿の情報
+#POST /match: 生徒のまとまりを割り当てる（match_batch）
+#POST /reload: 講師名簿を読み直す
+class MatchHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/health":
+            roster = self.server.roster
+            self.send_json(200, {"teacher_file": self.server.teacher_file, "teachers": len(roster.teachers)})
+        else:
+            self.send_json(404, {"error": f"見つかりません: {self.path}"})
+
+    def do_POST(self):
+        try:
+            if self.path == "/match":
+                self.send_json(200, match_batch(self.server.roster, self.read_json()))
+            elif self.path == "/reload":
+                roster = self.server.reload()
+                self.send_json(200, {"teacher_file": self.server.teacher_file, "teachers": len(roster.teachers)})
+            else:
+                self.send_json(404, {"error": f"見つかりません: {self.path}"})
+        except (ValueError, TypeError) as e:
+            self.send_json(400, {"error": str(e)})
+        except Exception as e:
+            log(f"[server] エラー: {str(e)}", logging.ERROR)
+            self.send_json(500, {"error": str(e)})
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            raise ValueError("依頼が大きすぎます")
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    #アクセスログは DEBUG のときだけ
+    def log_message(self, format, *args):
+        log(f"[server] {self.address_string()} {format % args}", logging.DEBUG)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="講師名簿を読み込んだまま、生徒のまとまりを HTTP/JSON で受け付けて割り当てる")
+    parser.add_argument("teacher_file", help="講師ファイル（.xlsx）")
+    parser.add_argument("--sheet", default=0, help="講師のシート（名前または番号）")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるアドレス（既定はこのPCからのみ）")
+    parser.add_argument("--port", type=int, default=8765, help="待ち受けるポート")
+    parser.add_argument("--log-level", default=None, help="ログレベル（DEBUG でアクセスログも出す）")
+    args = parser.parse_args(argv)
+
+    setup_logging(args.log_level)
+    sheet = int(args.sheet) if str(args.sheet).isdigit() else args.sheet
+    server = MatchServer((args.host, args.port), args.teacher_file, sheet)
+    print(f"待ち受け中: http://{args.host}:{server.server_port}/（講師 {len(server.roster.teachers)}件）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
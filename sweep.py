@@ -0,0 +1,116 @@
+import argparse
+import csv
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from MatchShinkan import read_people, match, setup_logging, setup_worker_logging
+
+#ワーカーごとに1回だけ受け取る解析済みデータ
+worker_teachers = None
+worker_students = None
+
+
+def init_worker(teachers, students, log_level):
+    global worker_teachers, worker_students
+    worker_teachers = teachers
+    worker_students = students
+    setup_worker_logging(log_level)
+
+
+#1つの設定で match を実行して集計する
+def run_config(params):
+    stats = {}
+    result, unmatched, unused_teachers = match(worker_teachers, worker_students, stats=stats, **params)
+    lessons = sum(len(matches) for matches in result.values())
+    open_slots = sum(t.slot is not None for t in unused_teachers)#読めなかった希望は枠に数えない
+    teacher_slots = lessons + open_slots
+    return {
+        **params,
+        "placed": stats["placed"],
+        "students_placed": len({m.student.name for matches in result.values() for m in matches}),
+        "unmatched": sum(len(entries) for entries in unmatched.values()),
+        "lessons": lessons,
+        "unused_teacher_slots": open_slots,
+        "teacher_utilization": round(lessons / teacher_slots, 3) if teacher_slots else 0.0,
+    }
+
+
+#設定の組み合わせ（分割しないときは split_interval を1通りにまとめる）
+def build_grid(options):
+    keys = list(options)
+    grid = []
+    seen = set()
+    for values in itertools.product(*(options[k] for k in keys)):
+        params = dict(zip(keys, values))
+        if not params["allow_split"]:
+            params["split_interval"] = options["split_interval"][0]
+        if params["engine"] == "flow":
+            params["prefer_continuous"] = False
+        key = tuple(sorted(params.items()))
+        if key not in seen:
+            seen.add(key)
+            grid.append(params)
+    return grid
+
+
+#解析は1回だけ行い、設定ごとの match をプロセスプールで並列に実行する
+def sweep(teachers, students, grid, workers=None, log_level="WARNING"):
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(teachers, students, log_level)) as pool:
+        summaries = list(pool.map(run_config, grid))
+    summaries.sort(key=lambda s: (-s["placed"], s["unmatched"], -s["teacher_utilization"]))
+    return summaries
+
+
+def int_list(text):
+    return [int(v) for v in text.split(",")]
+
+def bool_list(text):
+    return [v.strip().lower() in ("1", "true", "yes") for v in text.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="match() の設定を並列に比較する")
+    parser.add_argument("teacher_file")
+    parser.add_argument("student_file")
+    parser.add_argument("--max-pair", type=int_list, default=[2], help="例: 1,2,3")
+    parser.add_argument("--drum-max-per-slot", type=int_list, default=[1])
+    parser.add_argument("--max-per-instrument", type=int_list, default=[1])
+    parser.add_argument("--split-interval", type=int_list, default=[30])
+    parser.add_argument("--allow-split", type=bool_list, default=[False], help="例: 0,1")
+    parser.add_argument("--drum-exclusive", type=bool_list, default=[True])
+    parser.add_argument("--prefer-continuous", type=bool_list, default=[False])
+    parser.add_argument("--engine", type=lambda t: t.split(","), default=["greedy"], help="例: greedy,flow")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="並列数")
+    parser.add_argument("--csv", help="結果を CSV で保存するパス")
+    args = parser.parse_args(argv)
+
+    setup_logging("WARNING")
+    teachers = read_people(args.teacher_file)
+    students = read_people(args.student_file)
+    grid = build_grid({
+        "max_pair": args.max_pair,
+        "drum_max_per_slot": args.drum_max_per_slot,
+        "max_per_instrument": args.max_per_instrument,
+        "allow_split": args.allow_split,
+        "split_interval": args.split_interval,
+        "drum_exclusive": args.drum_exclusive,
+        "prefer_continuous": args.prefer_continuous,
+        "engine": args.engine,
+    })
+    summaries = sweep(teachers, students, grid, workers=args.workers)
+
+    columns = list(summaries[0]) if summaries else []
+    print("\t".join(columns))
+    for s in summaries:
+        print("\t".join(str(s[c]) for c in columns))
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(summaries)
+
+
+if __name__ == "__main__":
+    main()
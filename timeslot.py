@@ -0,0 +1,105 @@
+import re
+import datetime
+from functools import lru_cache
+from typing import NamedTuple
+import pandas as pd
+
+BASE_YEAR = 2000#日付に年がないので閏年を基準にする（2/29 も扱える）
+
+
+DATE_PATTERN = re.compile(r"(?:\d{4}[年/]?)?\s*(\d{1,2})[月/](\d{1,2})")
+TIME_TRANSLATION = str.maketrans("０１２３４５６７８９：－〜～", "0123456789:-~~")
+TIME_RANGE = re.compile(r"\d{1,2}:\d{2}-\d{1,2}:\d{2}")
+HOUR_RANGE = re.compile(r"^(\d{1,2})[-~](\d{1,2})$")
+HOUR_RANGE_JA = re.compile(r"^(\d{1,2})時[-~〜](\d{1,2})時$")
+#マッチング用の時間帯（"13:00 - 14:00" "13:00〜14:00" "13時~14時" など、区切りの前後の空白も許す）
+TIME_SPAN = re.compile(r"(\d{1,2}):(\d{2})\s*[-~]\s*(\d{1,2}):(\d{2})")
+HOUR_SPAN = re.compile(r"(\d{1,2})時?\s*[-~]\s*(\d{1,2})時?")
+
+
+#日付の正規化（"2025年6月1日" や "06/01" ➡ "6/1"）
+def convert_date(val):
+    if pd.isna(val): return ""
+    s = str(val).strip()
+    match = DATE_PATTERN.search(s)
+    if match: return f"{int(match.group(1))}/{int(match.group(2))}"
+    return s
+
+#時間帯の正規化（"13-14", "13時〜14時", 全角 ➡ "13:00-14:00" のリスト）
+def convert_time_list(val):
+    if pd.isna(val): return []
+    times = str(val).replace("，", ",").split(",")
+    result = []
+    for t in times:
+        t = t.strip().translate(TIME_TRANSLATION)
+        if TIME_RANGE.fullmatch(t):
+            result.append(t)
+        elif m := HOUR_RANGE.match(t):
+            result.append(f"{int(m.group(1)):02}:00-{int(m.group(2)):02}:00")
+        elif m := HOUR_RANGE_JA.match(t):
+            result.append(f"{int(m.group(1)):02}:00-{int(m.group(2)):02}:00")
+    return result
+
+
+#1コマ：日付（序数）と開始・終了（0:00 からの分）
+class Slot(NamedTuple):
+    day: int
+    start: int
+    end: int
+
+    #出力用の文字列
+    @property
+    def date(self):
+        d = datetime.date.fromordinal(self.day)
+        return f"{d.month}/{d.day}"
+
+    @property
+    def time(self):
+        return f"{self.start // 60:02}:{self.start % 60:02}-{self.end // 60:02}:{self.end % 60:02}"
+
+    def __str__(self):
+        return f"{self.date} {self.time}"
+
+
+#解釈済みの日付・時間帯の文字列は、この数だけ覚えておく（サーバーでは依頼ごとに新しい文字列が来るので上限を付ける）
+PARSE_CACHE_SIZE = 4096
+
+#"6/1" などの日付 ➡ 序数（読めなければ None）
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_date(text):
+    m = re.fullmatch(r"(\d{1,2})/(\d{1,2})", convert_date(text))
+    if not m: return None
+    try:
+        return datetime.date(BASE_YEAR, int(m.group(1)), int(m.group(2))).toordinal()
+    except ValueError:
+        return None
+
+#"13:00-14:00" などの時間帯 ➡ (開始分, 終了分)（読めなければ None）
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_time_range(text):
+    t = str(text).strip().translate(TIME_TRANSLATION)
+    if m := TIME_SPAN.fullmatch(t):
+        sh, sm, eh, em = map(int, m.groups())
+    elif m := HOUR_SPAN.fullmatch(t):
+        sh, eh = map(int, m.groups())
+        sm = em = 0
+    else:
+        return None
+    return sh * 60 + sm, eh * 60 + em
+
+#同じ枠は同じオブジェクトを使う（大きな名簿でも枠の数だけで済む。上限を超えた古い枠は作り直す）
+@lru_cache(maxsize=65536)
+def intern_slot(day, start, end):
+    return Slot(day, start, end)
+
+
+#時間分割（interval 分ごと、端数は捨てる）
+@lru_cache(maxsize=65536)
+def split_slot(slot, interval):
+    return tuple(intern_slot(slot.day, start, start + interval)
+                 for start in range(slot.start, slot.end - interval + 1, interval))
+
+#日付ごとのシート名（"6月1日"）
+def sheet_title(day):
+    d = datetime.date.fromordinal(day)
+    return f"{d.month}月{d.day}日"